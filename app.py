@@ -1,22 +1,24 @@
-from flask import Flask, request, render_template, session, jsonify
+from flask import Flask, Response, request, render_template, session, jsonify, stream_with_context, g
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnableBranch, RunnableSequence, RunnablePassthrough
 from dotenv import load_dotenv
 import secrets
 from flask_session import Session
 import time
+import json
 import logging
 
-logging.basicConfig(level=logging.INFO, 
-                    filename='app.log', 
-                    filemode='w', 
-                    format="%(asctime)s-%(name)s-%(levelname)s-%(message)s")
-
+from docflow.metrics import RequestIdFilter, REQUEST_SECONDS, _metrics, _span_recorder, new_request_id, set_request_id, span
 from docflow.prompts import Prompts
 from docflow.ingestion import File
-from docflow.qa_engine import DocumentQA, DocumentQAError, _vector_store
+from docflow.qa_engine import DocumentQA, DocumentQAError, ChatHistory, _vector_store, _answer_cache, _retrieval_cache, RERANKER_MODEL_PATH
+from docflow.jobs import IngestionQueue
+from docflow.generation import MapReduceGenerator, GenerationError
+from docflow.models import _model_registry
+from docflow.chains import _chain_registry
+from docflow.cache import get_result_cache
+from docflow.store import get_chunk_store
+from docflow.retrieval import PROFILES, RetrievalConfigError, get_retrieval_config
+from docflow.fakes import load_test_enabled
 
 
 load_dotenv()
@@ -26,23 +28,16 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.secret_key = secrets.token_hex(16) 
 app.config['UPLOAD_FOLDER'] = 'uploads'
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 app.config["SESSION_TYPE"] = "filesystem"
-Session(app)
 
 files = File(app)
-
-try:
-    logger.info('Initializing Gemini')
-    gemini = ChatGoogleGenerativeAI(
-        model="gemini-2.0-flash",
-        temperature=0.5
-    )
-
-except Exception:
-    logger.critical("Gemini Couldn't be initialized", exc_info=True, stack_info=True)
-
-parser = StrOutputParser()
+ingestion_queue = IngestionQueue(files,
+                                 _vector_store,
+                                 max_workers=int(os.getenv('PAPERMIND_INGEST_WORKERS', 2)),
+                                 loader_threads=int(os.getenv('PAPERMIND_LOADER_THREADS', 8)),
+                                 batch_size=int(os.getenv('PAPERMIND_INGEST_BATCH_SIZE', 256)),
+                                 link_ttl=float(os.getenv('PAPERMIND_LINK_TTL', 3600)),
+                                 precompute_rerank=os.getenv('PAPERMIND_PRECOMPUTE_RERANK', '1') == '1')
 
 summarise_prompt = Prompts.SummaryPrompt
 faq_prompt = Prompts.FAQPrompt
@@ -50,15 +45,157 @@ guide_prompt = Prompts.GuidePrompt
 timeline_prompt = Prompts.TimelinePrompt
 map_prompt = Prompts.MindMapPrompt
 
+def get_generator() -> MapReduceGenerator:
+    """Study-material generator shared by every request, built on first use"""
+    return _chain_registry.get('generator', lambda: MapReduceGenerator(
+        _chain_registry.get_llm(),
+        {'summarise': summarise_prompt,
+         'faq': faq_prompt,
+         'guide': guide_prompt,
+         'timeline': timeline_prompt,
+         'map': map_prompt},
+        max_concurrency=int(os.getenv('PAPERMIND_MAP_CONCURRENCY', 8)),
+        cache=get_result_cache()
+    ))
+
+def create_app() -> Flask:
+    """
+    Configure logging and server-side sessions and initialize Gemini and the local models,
+    then return the app. Importing this module has no such side effects, so PDF extraction
+    processes, which re-import the main module, don't repeat them or create runtime directories.
+    """
+    logging.basicConfig(level=logging.INFO, 
+                        filename='app.log', 
+                        filemode='w', 
+                        format="%(asctime)s-%(name)s-%(levelname)s-%(request_id)s-%(message)s")
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(RequestIdFilter())
+
+    Session(app)
+    _save_session = app.session_interface.save_session
+
+    def save_session(*args, **kwargs):
+        """Flask-Session writing the session after a request, timed as a pipeline stage"""
+        with span('session_serialize'):
+            return _save_session(*args, **kwargs)
+
+    app.session_interface.save_session = save_session
+
+    if load_test_enabled():
+        logger.warning('Load-test mode: Gemini and Google embeddings are replaced by local fakes')
+
+    try:
+        logger.info('Initializing Gemini')
+        _chain_registry.qa_chain
+        get_generator()
+
+    except Exception:
+        logger.critical("Gemini Couldn't be initialized", exc_info=True, stack_info=True)
+
+    if os.getenv('PAPERMIND_WARMUP_MODELS', '0') == '1':
+        try:
+            logger.info('Warming up local models')
+            _model_registry.warm_up(RERANKER_MODEL_PATH, truncate_dim=512)
+        except Exception:
+            logger.error("Local models couldn't be warmed up", exc_info=True)
+
+    return app
+
+@app.before_request
+def start_request():
+    """Tag the request's spans and logs with its id, reusing the caller's X-Request-ID, and start its timer"""
+    g.request_id = new_request_id(request.headers.get('X-Request-ID'))
+    g.request_start = time.perf_counter()
+    set_request_id(g.request_id)
+
+def observe_request(start: float, labels: dict):
+    REQUEST_SECONDS.observe(time.perf_counter() - start, **labels)
+
+def timed_body(body, start: float, labels: dict):
+    """Yield a streamed body, observing the request once it is sent or abandoned"""
+    try:
+        yield from body
+    finally:
+        observe_request(start, labels)
+
+@app.after_request
+def record_request(response):
+    """
+    Return the request id, and in load-test mode the time spent in the app so the
+    load-test driver can split it from queueing. A streamed body is timed until its
+    last chunk is sent, other requests once the session is saved in teardown_request.
+    """
+    response.headers['X-Request-ID'] = g.get('request_id', '')
+    if 'request_start' in g:
+        if load_test_enabled():
+            response.headers['Server-Timing'] = f'app;dur={(time.perf_counter() - g.request_start) * 1000:.1f}'
+        g.request_labels = {'method': request.method,
+                            'route': request.url_rule.rule if request.url_rule else 'unmatched',
+                            'status': response.status_code}
+        if response.is_streamed:
+            response.response = timed_body(response.response, g.pop('request_start'), g.request_labels)
+    return response
+
+@app.teardown_request
+def finish_request(exc):
+    start = g.pop('request_start', None)
+    if start is not None and 'request_labels' in g:
+        observe_request(start, g.request_labels)
+
+
+def get_session_id() -> str:
+    """Get the id partitioning this session's data, creating one if needed"""
+    if 'session_id' not in session:
+        session['session_id'] = secrets.token_hex(8)
+    return session['session_id']
+
+def sync_upload_jobs():
+    """Merge the results of finished ingestion jobs into the session"""
+    pending = session.get('upload_jobs', [])
+    if not pending:
+        return
+
+    still_pending = []
+    for job_id in pending:
+        job = ingestion_queue.get(job_id)
+        if job is None:
+            logger.warning(f"Ingestion job {job_id} is no longer tracked")
+            continue
+        if not job.done:
+            still_pending.append(job_id)
+            continue
+
+        is_uploaded = session.get('is_uploaded', [])
+        failed = job.failed if job.status == 'completed' else job.failed + job.uploaded
+        session['is_uploaded'] = [file_id for file_id in is_uploaded if file_id not in failed]
+
+        if job.status == 'completed':
+            upload_meta = session.get('upload_meta', {'count': 0, 'files': []})
+            known = {file['doc_id'] for file in upload_meta['files']}
+            new_files = [file for file in job.files if file['doc_id'] not in known]
+
+            upload_meta['count'] = upload_meta['count'] + len(new_files)
+            upload_meta['files'].extend(new_files)
+            session['upload_meta'] = upload_meta
+            logger.info(f"Merged ingestion job {job_id} into the session")
+
+    session['upload_jobs'] = still_pending
+
+def pending_source_count() -> int:
+    """Sources of this session's uploads that are still queued or running"""
+    count = 0
+    for job_id in session.get('upload_jobs', []):
+        job = ingestion_queue.get(job_id)
+        if job is not None and not job.done:
+            count += job.total
+    return count
 
 @app.route('/upload', methods=['POST'])
 def upload():
     upload_time = time.time()
-    logger.info("Uploading & processing files")
-    text = []
+    logger.info("Uploading files")
+    sync_upload_jobs()
 
-    if 'raw_text' not in session:
-        session['raw_text'] = []
     if 'is_uploaded' not in session:
         session['is_uploaded'] = []
     if 'upload_meta' not in session:
@@ -67,10 +204,6 @@ def upload():
             'files': []
         }
     
-    upload_count = session.get('upload_meta', {'count': 0, 'files': []})['count']
-    if upload_count > 10:
-        return "Can only upload upto 10 sources.", 500
-
     input_groups = set()
     for key in request.form.keys():
         if key.startswith('file_type_'):
@@ -78,9 +211,14 @@ def upload():
             input_groups.add(group_id)
 
     currently_uploaded = session.get('is_uploaded', [])
-    new_uploads = []
+    new_groups = [group_id for group_id in input_groups
+                  if request.form.get(f'file_type_{group_id}') and f'file_type_{group_id}' not in currently_uploaded]
+
+    if pending_source_count() + session['upload_meta']['count'] + len(new_groups) > 10:
+        return "Can only upload upto 10 sources.", 500
 
-    print(input_groups)
+    sources = []
+    upload_id = secrets.token_hex(8)
     
     for group_id in sorted(input_groups):
         file_id = f'file_type_{group_id}'
@@ -88,44 +226,35 @@ def upload():
         
         if file_type and file_id not in currently_uploaded:
             try:
-                content, metadata = files.file_loader(file_type, request, group_id, upload_time)
-                if content: 
-                    text.extend(content)
-                    new_uploads.append(file_id)
-                    
-                    upload_meta = session.get('upload_meta', {'count': 0, 'files': []})
-                    upload_meta['count'] = upload_meta['count'] + 1
-                    upload_meta['files'].append(metadata)
-                    session['upload_meta'] = upload_meta
-                    
+                sources.append(files.prepare_source(file_type, request, group_id, upload_id))
             except Exception as e:
-                logger.error(f'Could not process file for group {group_id}: {e}')
+                logger.error(f'Could not accept file for group {group_id}: {e}')
                 continue
 
-    if len(text) == 0:
+    if len(sources) == 0:
         return "No content to process", 400
 
-    existing_text = session.get('raw_text', [])
-    existing_text.extend(text)
-    session['raw_text'] = existing_text
-    
+    job = ingestion_queue.submit(get_session_id(), sources, upload_time, job_id=upload_id)
+
     is_uploaded = session.get('is_uploaded', [])
-    is_uploaded.extend(new_uploads)
+    is_uploaded.extend(f"file_type_{source['group_id']}" for source in sources)
     session['is_uploaded'] = is_uploaded
+    session['upload_jobs'] = session.get('upload_jobs', []) + [job.id]
 
-    logger.info(f"Files uploaded & indexed successfully.")
+    return jsonify(job.to_dict()), 202
 
-    try:
-        logger.info("Adding documents to vectorstore")
-        _vector_store.add_documents(text)
-    except Exception as e:
-        logger.error(f"Failed to add documents to vectorstore: {e}")
-        return f"Error adding documents to vectorstore", 500
-
-    return f"Files uploaded & indexed successfully!"
+@app.route('/upload/<job_id>', methods=['GET'])
+def upload_status(job_id):
+    """Get the progress of an ingestion job"""
+    job = ingestion_queue.get(job_id)
+    if job is None or job.session_id != session.get('session_id'):
+        return jsonify({'error': 'Unknown upload job'}), 404
+    sync_upload_jobs()
+    return jsonify(job.to_dict()), 200
 
 @app.route('/upload-meta', methods=['GET'])
 def get_upload_meta():
+    sync_upload_jobs()
     if 'upload_meta' not in session:
         return jsonify({'count': 0, 'files': []}), 200
     return jsonify(session['upload_meta']), 200
@@ -138,51 +267,48 @@ def index():
         logger.info('Fetching Query')
         query = request.form.get('query', '').lower().strip()
 
-        text = session.get('raw_text', [])
+        sync_upload_jobs()
+        text = get_chunk_store().get(session.get('session_id'))
 
         if len(text) == 0:
             logger.error("No uploaded text found — user needs to upload first!")
             return "No files uploaded yet! Please upload files first.", 400
 
-        input_data = {"mode": query, "text": text}
-
-        summariser_chain = RunnableSequence(summarise_prompt, gemini, parser)
-        faq_chain = RunnableSequence(faq_prompt, gemini, parser)
-        guide_chain = RunnableSequence(guide_prompt, gemini, parser)
-        timeline_chain = RunnableSequence(timeline_prompt, gemini, parser)
-        map_chain = RunnableSequence(map_prompt, gemini, parser)
+        generator = get_generator()
+        if query not in generator.modes:
+            logger.error(f"Unknown task requested: {query}")
+            return f"Unknown task: {query}", 400
 
-        branch_chain = RunnableBranch(
-            (lambda x: x["mode"] == "summarise", summariser_chain),
-            (lambda x: x["mode"] == "faq", faq_chain),
-            (lambda x: x['mode'] == 'guide', guide_chain),
-            (lambda x: x['mode'] == 'timeline', timeline_chain),
-            (lambda x: x['mode'] == 'map', map_chain),
-            RunnablePassthrough()
-        )
-
-        logger.info('Branch Chain Invoked')
-        result = branch_chain.invoke(input_data)
+        try:
+            logger.info(f'Generating {query}')
+            result = generator.invoke(query, text)
+        except GenerationError as e:
+            logger.error(f"Generation failed: {e}")
+            return "Failed to generate the requested material.", 500
 
     return render_template('index.html', result=result)
 
 @app.route('/chat', methods=['GET', 'POST'])
 def chat():
-    if 'chat_history' not in session:
-        session['chat_history'] = []
-    
     if request.method == 'POST':
         try:
-            user_query = request.get_json().get('message', '').strip()
+            payload = request.get_json()
+            user_query = payload.get('message', '').strip()
             
             if not user_query:
                 return {"error": "Empty query provided"}, 400
+
+            try:
+                config = get_retrieval_config(payload.get('profile'))
+            except RetrievalConfigError as e:
+                return {"error": str(e)}, 400
             
-            if not session.get('raw_text'):
+            sync_upload_jobs()
+            if not get_chunk_store().count(session.get('session_id')):
                 return {"error": "No documents uploaded. Please upload documents first."}, 400
             
             try:
-                doc_qa = DocumentQA(session)
+                doc_qa = DocumentQA(session, config=config)
                 logger.info("DocumentQA initialized for chat")
             except DocumentQAError as e:
                 return {"error": "Failed to initialize chat system"}, 500
@@ -198,25 +324,149 @@ def chat():
             logger.error(f"Unexpected error in chat: {e}")
             return {"error": "An unexpected error occurred"}, 500
     
-    chat_history = session.get('chat_history', [])
+    chat_history = ChatHistory(session).get_history()
     
     return render_template('chat.html', chat_history=chat_history)
     
+def sse(event: str, data) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Stream the answer to a chat message as Server-Sent Events: sources, tokens, then done"""
+    payload = request.get_json(silent=True) or {}
+    user_query = payload.get('message', '').strip()
+    if not user_query:
+        return {"error": "Empty query provided"}, 400
+
+    try:
+        config = get_retrieval_config(payload.get('profile'))
+    except RetrievalConfigError as e:
+        return {"error": str(e)}, 400
+
+    sync_upload_jobs()
+    if not get_chunk_store().count(session.get('session_id')):
+        return {"error": "No documents uploaded. Please upload documents first."}, 400
+
+    try:
+        doc_qa = DocumentQA(session, config=config)
+        cached = doc_qa.cached_answer(user_query)
+        if cached is None:
+            message, sources = doc_qa.prepare(user_query)
+        else:
+            response, sources = cached
+    except (DocumentQAError, ValueError) as e:
+        logger.error(f"Failed to prepare streamed chat: {e}")
+        return {"error": "Failed to process your question"}, 500
+
+    def generate():
+        yield sse('sources', sources)
+        try:
+            tokens = [response] if cached is not None else doc_qa.stream(message, sources)
+            for token in tokens:
+                yield sse('token', token)
+            yield sse('done', {})
+        except Exception as e:
+            logger.error(f"Streaming chat failed: {e}")
+            yield sse('error', {"error": "Failed to process your question"})
+
+    return Response(stream_with_context(generate()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/generate/stream', methods=['POST'])
+def generate_stream():
+    """Stream study material for the requested task as Server-Sent Events"""
+    query = request.form.get('query', '').lower().strip()
+
+    sync_upload_jobs()
+    text = get_chunk_store().get(session.get('session_id'))
+
+    if len(text) == 0:
+        logger.error("No uploaded text found — user needs to upload first!")
+        return "No files uploaded yet! Please upload files first.", 400
+
+    generator = get_generator()
+    if query not in generator.modes:
+        logger.error(f"Unknown task requested: {query}")
+        return f"Unknown task: {query}", 400
+
+    def generate():
+        try:
+            logger.info(f'Streaming {query}')
+            for token in generator.stream(query, text):
+                yield sse('token', token)
+            yield sse('done', {})
+        except GenerationError as e:
+            logger.error(f"Generation failed: {e}")
+            yield sse('error', {"error": "Failed to generate the requested material."})
+
+    return Response(stream_with_context(generate()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/session-status', methods=['GET'])
 def session_status():
     """Get current session status for debugging"""
+    sync_upload_jobs()
     return jsonify({
-        'raw_text_count': len(session.get('raw_text', [])),
+        'session_id': session.get('session_id'),
+        'chunk_count': get_chunk_store().count(session.get('session_id')),
+        'upload_jobs': session.get('upload_jobs', []),
         'uploaded_files': session.get('is_uploaded', []),
         'upload_meta': session.get('upload_meta', {'count': 0, 'files': []})
     })  
 
+@app.route('/model-status', methods=['GET'])
+def model_status():
+    """Get memory usage of the locally loaded models"""
+    return jsonify(_model_registry.memory_usage())
+
+@app.route('/retrieval-profiles', methods=['GET'])
+def retrieval_profiles():
+    """List the retrieval profiles a chat request can select with 'profile'"""
+    return jsonify({name: config.to_dict() for name, config in PROFILES.items()})
+
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """Get hit and miss counters of the retrieval, answer and study-mode caches"""
+    generator = get_generator()
+    return jsonify({
+        'retrieval': _retrieval_cache.stats(),
+        'answers': _answer_cache.stats() if _answer_cache else None,
+        'results': generator.cache.stats() if generator.cache else None
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Stage and request latency histograms in the Prometheus text format"""
+    return Response(_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/traces/<request_id>', methods=['GET'])
+def trace(request_id):
+    """Spans recorded for a recent request, found by its X-Request-ID"""
+    spans = _span_recorder.spans(request_id)
+    if not spans:
+        return jsonify({'error': 'Unknown or expired request id'}), 404
+    return jsonify({'request_id': request_id, 'spans': spans})
+
 @app.route('/reset-session', methods=['POST'])
 def reset_session():
     """Reset session data - useful for testing"""
+    if 'session_id' in session:
+        try:
+            _vector_store.delete_session(session['session_id'])
+        except Exception as e:
+            logger.error(f"Failed to delete session vectors: {e}")
+        try:
+            get_chunk_store().delete_session(session['session_id'])
+            ChatHistory(session).clear_history()
+        except Exception as e:
+            logger.error(f"Failed to delete session chunks and messages: {e}")
     session.clear()
     logger.info("Session and vector store cleared")
     return "Session reset successfully!"
 
 if __name__ == '__main__':
-    app.run(debug=True, use_evalex=False, use_reloader=False)
+    create_app().run(debug=True, use_evalex=False, use_reloader=False)
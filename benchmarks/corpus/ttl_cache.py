@@ -0,0 +1,113 @@
+"""A small time-aware LRU cache used by the ingestion service."""
+from collections import OrderedDict
+import threading
+import time
+
+MAX_ENTRIES = 512
+DEFAULT_TTL_SECONDS = 300
+
+
+class CacheMiss(KeyError):
+    """Raised by TTLCache.require when a key is absent or expired."""
+
+
+class TTLCache:
+    """
+    Least recently used cache whose entries also expire after ttl seconds.
+    Reads move an entry to the most recently used end, writes evict the
+    least recently used entries once max_entries is exceeded.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl: float = DEFAULT_TTL_SECONDS, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def require(self, key):
+        """Return the value for key or raise CacheMiss."""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            raise CacheMiss(key)
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        with self._lock:
+            self._entries[key] = (self._clock() + (ttl or self.ttl), value)
+            self._entries.move_to_end(key)
+            self._evict_overflow()
+
+    def _evict_overflow(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def evict_expired(self) -> int:
+        """Drop every expired entry, returning how many were removed."""
+        now = self._clock()
+        with self._lock:
+            expired = [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]
+            for key in expired:
+                del self._entries[key]
+        return len(expired)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def memoize(ttl: float = DEFAULT_TTL_SECONDS, max_entries: int = MAX_ENTRIES):
+    """Decorator caching a function's results by its positional arguments."""
+    def decorator(function):
+        cache = TTLCache(max_entries=max_entries, ttl=ttl)
+
+        def wrapper(*args):
+            value = cache.get(args)
+            if value is None:
+                value = function(*args)
+                cache.set(args, value)
+            return value
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+class BackoffPolicy:
+    """Exponential backoff with jitter for retrying failed fetches."""
+
+    def __init__(self, base_delay: float = 0.5, max_delay: float = 30.0, factor: float = 2.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.factor = factor
+
+    def delay_for(self, attempt: int, jitter: float = 0.1) -> float:
+        delay = min(self.max_delay, self.base_delay * self.factor ** attempt)
+        return delay * (1 + jitter)
+
+
+def fetch_with_retries(fetch, url: str, attempts: int = 5, policy: BackoffPolicy = None, sleep=time.sleep):
+    """Call fetch(url), retrying with backoff on ConnectionError."""
+    policy = policy or BackoffPolicy()
+    for attempt in range(attempts):
+        try:
+            return fetch(url)
+        except ConnectionError:
+            if attempt == attempts - 1:
+                raise
+            sleep(policy.delay_for(attempt))
@@ -0,0 +1,300 @@
+"""
+Load-test driver.
+
+Simulates concurrent users against a running PaperMind server: every user uploads a
+pasted document, tagged per flow so no flow is served from the caches, waits for
+ingestion, generates a summary on /, asks a few /chat questions and resets its session,
+over and over until the duration runs out. Writes throughput, per-route latency
+percentiles, error counts and the server's own timing (Server-Timing header) as JSON,
+plus CPU and memory of the server process when its pid is given.
+
+Start the server in load-test mode so Gemini and the Google embeddings are local fakes:
+
+    PAPERMIND_LOAD_TEST=1 waitress-serve --threads 32 --port 8000 --call app:create_app
+    python benchmarks/load_test.py --users 8 16 32 --duration 60 --server-pid <pid>
+
+Each --users value is run in turn, so one invocation sweeps the concurrency levels.
+"""
+from collections import defaultdict
+from datetime import datetime, timezone
+from http.cookiejar import CookieJar
+import urllib.request
+import urllib.error
+import urllib.parse
+import threading
+import argparse
+import json
+import time
+import sys
+import os
+import re
+
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+QUESTIONS = [
+    "What is the main idea of the document?",
+    "Which components does the architecture have?",
+    "How is attention computed?",
+    "What are the limitations mentioned?",
+    "Summarise the training setup.",
+]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Simulate concurrent PaperMind users and measure the server.")
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--users', type=int, nargs='+', default=[4, 8, 16], help="Concurrent users, one run per value")
+    parser.add_argument('--duration', type=float, default=60, help="Seconds per run")
+    parser.add_argument('--chat-turns', type=int, default=3, help="/chat questions per flow")
+    parser.add_argument('--mode', default='summarise', help="Study mode requested on /")
+    parser.add_argument('--document', default=os.path.join(BENCHMARK_DIR, 'corpus', 'transformers.txt'))
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--backoff', type=float, default=0.5,
+                        help="Seconds a user waits after a failed flow, doubling on each further failure up to 16x")
+    parser.add_argument('--server-pid', type=int, default=None, help="Sample CPU and memory of this process from /proc")
+    parser.add_argument('--output', default=os.path.join(BENCHMARK_DIR, 'results', 'load_test.json'))
+    return parser.parse_args()
+
+
+def percentiles(samples: list[float]) -> dict:
+    values = np.array(samples) * 1000
+    return {'p50': float(np.percentile(values, 50)), 'p95': float(np.percentile(values, 95)),
+            'p99': float(np.percentile(values, 99)), 'max': float(values.max()), 'mean': float(values.mean())}
+
+
+def server_timing(header: str | None) -> dict:
+    """Durations in milliseconds from a Server-Timing header"""
+    if not header:
+        return {}
+    return {name: float(duration) for name, duration in re.findall(r'(\w+);dur=([\d.]+)', header)}
+
+
+class Recorder:
+    """Thread-safe per-route samples of one run"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.timings = defaultdict(lambda: defaultdict(list))
+        self.errors = defaultdict(lambda: defaultdict(int))
+        self.flows = 0
+        self._lock = threading.Lock()
+
+    def record(self, route: str, seconds: float, status: int, timing: dict):
+        with self._lock:
+            self.latencies[route].append(seconds)
+            for name, duration in timing.items():
+                self.timings[route][name].append(duration / 1000)
+            if status >= 400:
+                self.errors[route][str(status)] += 1
+
+    def error(self, route: str, kind: str):
+        with self._lock:
+            self.errors[route][kind] += 1
+
+    def flow_done(self):
+        with self._lock:
+            self.flows += 1
+
+
+class User:
+    """One simulated browser with its own session cookie"""
+
+    def __init__(self, user_id: int, args: argparse.Namespace, document: str, recorder: Recorder):
+        self.user_id = user_id
+        self.args = args
+        self.document = document
+        self.flows = 0
+        self.recorder = recorder
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def request(self, route: str, path: str, form: dict = None, payload: dict = None) -> tuple[int, bytes]:
+        data, headers = None, {}
+        if form is not None:
+            data = urllib.parse.urlencode(form).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif payload is not None:
+            data = json.dumps(payload).encode()
+            headers['Content-Type'] = 'application/json'
+        req = urllib.request.Request(self.args.url.rstrip('/') + path, data=data, headers=headers)
+
+        start = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=self.args.timeout) as response:
+                body = response.read()
+                status, timing = response.status, server_timing(response.headers.get('Server-Timing'))
+        except urllib.error.HTTPError as e:
+            body = e.read()
+            status, timing = e.code, server_timing(e.headers.get('Server-Timing'))
+        except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+            self.recorder.error(route, type(e).__name__)
+            return 0, b''
+        self.recorder.record(route, time.perf_counter() - start, status, timing)
+        return status, body
+
+    def next_document(self) -> str:
+        """
+        The document tagged on every line with the user and flow, so no two flows share
+        a chunk and every upload is embedded, indexed and answered without cache hits.
+        Chunks are longer than the corpus lines, so each one carries a tag.
+        """
+        self.flows += 1
+        tag = f"[user {self.user_id} flow {self.flows}]"
+        return '\n'.join(f"{line} {tag}" if line.strip() else line for line in self.document.split('\n'))
+
+    def flow(self, deadline: float) -> bool:
+        """Upload, summarise, chat and reset, returning whether every step succeeded"""
+        self.request('GET /', '/')
+        status, body = self.request('POST /upload', '/upload', form={'file_type_1': 'pasted', 'pasted_1': self.next_document()})
+        if status != 202:
+            return False
+
+        job_id = json.loads(body)['job_id']
+        while True:
+            status, body = self.request('GET /upload/<job_id>', f'/upload/{job_id}')
+            if status != 200:
+                return False
+            job = json.loads(body)
+            if job['status'] in ('completed', 'failed'):
+                break
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.2)
+        if job['status'] != 'completed':
+            self.recorder.error('GET /upload/<job_id>', 'ingestion failed')
+            return False
+
+        status, _ = self.request('POST /', '/', form={'query': self.args.mode})
+        ok = status == 200
+        for turn in range(self.args.chat_turns):
+            if time.monotonic() > deadline:
+                break
+            question = QUESTIONS[(self.user_id + turn) % len(QUESTIONS)]
+            status, _ = self.request('POST /chat', '/chat', payload={'message': question})
+            ok = ok and status == 200
+
+        self.request('POST /reset-session', '/reset-session', form={})
+        return ok
+
+    def run(self, deadline: float):
+        failures = 0
+        while time.monotonic() < deadline:
+            try:
+                ok = self.flow(deadline)
+            except Exception as e:
+                self.recorder.error('flow', type(e).__name__)
+                ok = False
+            if ok:
+                self.recorder.flow_done()
+                failures = 0
+                continue
+            # Back off so an unreachable or failing server isn't hammered with retries
+            delay = self.args.backoff * 2 ** min(failures, 4)
+            failures += 1
+            time.sleep(max(0.0, min(delay, deadline - time.monotonic())))
+
+
+class ProcessSampler(threading.Thread):
+    """Samples CPU and resident memory of a process from /proc"""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.cpu = []
+        self.rss = []
+        self._finished = threading.Event()
+        self._ticks = os.sysconf('SC_CLK_TCK')
+        self._page = os.sysconf('SC_PAGE_SIZE')
+
+    def read(self) -> tuple[float, int]:
+        with open(f'/proc/{self.pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        # utime and stime are fields 14 and 15, rss is field 24 of /proc/<pid>/stat
+        return (int(fields[11]) + int(fields[12])) / self._ticks, int(fields[21]) * self._page
+
+    def run(self):
+        previous, previous_time = self.read()[0], time.monotonic()
+        while not self._finished.wait(self.interval):
+            cpu, rss = self.read()
+            now = time.monotonic()
+            self.cpu.append((cpu - previous) / (now - previous_time))
+            self.rss.append(rss)
+            previous, previous_time = cpu, now
+
+    def stop(self) -> dict:
+        self._finished.set()
+        self.join()
+        if not self.cpu:
+            return {}
+        return {'cpu_cores_mean': float(np.mean(self.cpu)), 'cpu_cores_max': float(np.max(self.cpu)),
+                'rss_mb_mean': float(np.mean(self.rss)) / 1e6, 'rss_mb_max': float(np.max(self.rss)) / 1e6}
+
+
+def run(args: argparse.Namespace, users: int, document: str) -> dict:
+    recorder = Recorder()
+    sampler = ProcessSampler(args.server_pid) if args.server_pid else None
+    if sampler:
+        sampler.start()
+
+    start = time.monotonic()
+    deadline = start + args.duration
+    threads = [threading.Thread(target=User(user_id, args, document, recorder).run, args=(deadline,))
+               for user_id in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    requests = sum(len(samples) for samples in recorder.latencies.values())
+    return {
+        'users': users,
+        'seconds': elapsed,
+        'flows': recorder.flows,
+        'requests': requests,
+        'requests_per_second': requests / elapsed,
+        'flows_per_minute': recorder.flows / elapsed * 60,
+        'routes': {route: {
+            'requests': len(samples),
+            'requests_per_second': len(samples) / elapsed,
+            'latency_ms': percentiles(samples),
+            'server_ms': {name: percentiles(values) for name, values in recorder.timings[route].items()},
+            'errors': dict(recorder.errors[route])
+        } for route, samples in sorted(recorder.latencies.items())},
+        'errors': {route: dict(errors) for route, errors in recorder.errors.items()},
+        'server_process': sampler.stop() if sampler else None
+    }
+
+
+def main():
+    args = parse_args()
+    with open(args.document, 'r', encoding='utf-8') as f:
+        document = f.read()
+
+    runs = []
+    for users in args.users:
+        print(f"Running {users} users for {args.duration:.0f}s against {args.url}", file=sys.stderr)
+        result = run(args, users, document)
+        runs.append(result)
+        chat = result['routes'].get('POST /chat', {}).get('latency_ms', {})
+        print(f"{users:>4} users: {result['requests_per_second']:.1f} req/s, {result['flows_per_minute']:.1f} flows/min, "
+              f"chat p50={chat.get('p50', 0):.0f}ms p99={chat.get('p99', 0):.0f}ms, "
+              f"errors={sum(sum(errors.values()) for errors in result['errors'].values())}")
+
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'url': args.url,
+        'duration': args.duration,
+        'chat_turns': args.chat_turns,
+        'mode': args.mode,
+        'runs': runs
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""
+Offline retrieval benchmark.
+
+Ingests the fixed corpus in benchmarks/corpus (text, code, notebook, PDF) with the
+deterministic hashing embeddings, replays the labelled queries in
+benchmarks/queries.json through DocumentQA's retriever chain for every retrieval
+profile, and writes recall@k, MRR, per-stage latency percentiles and ingest
+throughput as JSON for regression tracking.
+
+    python benchmarks/retrieval.py --profiles chat fast recall --output results.json
+
+Profiles that re-rank need the local re-ranker model (--rerank-model). Without it
+candidates are truncated to rerank_top_n instead and the result says so.
+"""
+from datetime import datetime, timezone
+import argparse
+import tempfile
+import logging
+import json
+import time
+import sys
+import os
+
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SESSION_ID = 'benchmark'
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure retrieval quality and latency on a fixed corpus.")
+    parser.add_argument('--corpus', default=os.path.join(BENCHMARK_DIR, 'corpus'))
+    parser.add_argument('--queries', default=os.path.join(BENCHMARK_DIR, 'queries.json'))
+    parser.add_argument('--profiles', nargs='+', default=['chat', 'fast', 'recall'])
+    parser.add_argument('--rerank-model', default=None, help="Path of the re-ranker model, defaults to RERANKER_MODEL_PATH")
+    parser.add_argument('--chunk-size', type=int, default=None)
+    parser.add_argument('--chunk-overlap', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=3, help="Timed passes over the query set per profile")
+    parser.add_argument('--output', default=os.path.join(BENCHMARK_DIR, 'results', 'retrieval.json'))
+    return parser.parse_args()
+
+
+def percentiles(samples: list[float]) -> dict:
+    values = np.array(samples) * 1000
+    return {'p50': float(np.percentile(values, 50)), 'p95': float(np.percentile(values, 95)), 'mean': float(values.mean())}
+
+
+def corpus_sources(corpus_dir: str, File) -> list[dict]:
+    """Sources for every file of the corpus, shaped like File.prepare_source output"""
+    sources = []
+    names = sorted(name for name in os.listdir(corpus_dir) if os.path.isfile(os.path.join(corpus_dir, name)))
+    for group_id, name in enumerate(names):
+        path = os.path.join(corpus_dir, name)
+        ext = name.rsplit('.', 1)[-1].lower()
+        # txt is also a supported code extension, so plain text is checked first
+        file_type = 'text' if ext == 'txt' else 'pdf' if ext == 'pdf' else 'code' if ext in File.SUPPORTED_FILE_TYPES else 'text'
+        source = {'group_id': group_id, 'file_type': file_type, 'path': path, 'ext': ext, 'name': name, 'text': None}
+        source['hash'] = File.source_hash(source)
+        sources.append(source)
+    return sources
+
+
+def ingest(sources: list[dict], vector_store, re_ranker, File) -> tuple[list[dict], dict]:
+    """Load, split and index the corpus, timing each step"""
+    upload_time = time.time()
+    chunks, per_source = [], {}
+    start = time.perf_counter()
+    for source in sources:
+        source_start = time.perf_counter()
+        source_chunks = list(File.iter_chunks(source, upload_time))
+        per_source[source['name']] = {'chunks': len(source_chunks), 'seconds': time.perf_counter() - source_start}
+        chunks.extend(source_chunks)
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vector_store.add_documents(chunks, SESSION_ID)
+    index_seconds = time.perf_counter() - start
+
+    precompute_seconds = None
+    if re_ranker is not None:
+        start = time.perf_counter()
+        re_ranker.precompute([chunk['text'] for chunk in chunks])
+        precompute_seconds = time.perf_counter() - start
+
+    total_bytes = sum(os.path.getsize(source['path']) for source in sources)
+    total_seconds = load_seconds + index_seconds + (precompute_seconds or 0)
+    return chunks, {
+        'sources': per_source,
+        'chunks': len(chunks),
+        'bytes': total_bytes,
+        'load_split_seconds': load_seconds,
+        'index_seconds': index_seconds,
+        'rerank_precompute_seconds': precompute_seconds,
+        'chunks_per_second': len(chunks) / total_seconds,
+        'megabytes_per_second': total_bytes / 1e6 / total_seconds
+    }
+
+
+def first_relevant(documents: list, query: dict) -> int | None:
+    """1-based rank of the first chunk from the labelled source containing the labelled text"""
+    for rank, document in enumerate(documents, 1):
+        if document.metadata.get('name') == query['doc'] and query['contains'] in document.page_content:
+            return rank
+    return None
+
+
+def evaluate(doc_qa, config, queries: list[dict], repeat: int) -> dict:
+    """Replay the queries stage by stage, then through the whole retriever chain"""
+    stages = {'retrieve': [], 'rerank': [], 'combine': [], 'chain': []}
+    ranks, candidate_hits, misses = [], 0, []
+
+    for run in range(repeat + 1):
+        for query in queries:
+            text = query['query']
+            start = time.perf_counter()
+            retrieved = doc_qa.retriever.invoke(text)
+            retrieved_at = time.perf_counter()
+            if config.rerank:
+                ranked = doc_qa.re_ranker.invoke({'query': text, 'retrieved': retrieved, 'top_k': config.rerank_top_n})
+            else:
+                ranked = retrieved[:config.rerank_top_n]
+            ranked_at = time.perf_counter()
+            doc_qa.combine_context(ranked)
+            combined_at = time.perf_counter()
+            doc_qa.retriever_chain.invoke(text)
+            chained_at = time.perf_counter()
+
+            # The first pass warms up models and caches and is only used for quality
+            if run == 0:
+                rank = first_relevant(ranked, query)
+                ranks.append(rank)
+                candidate_hits += first_relevant(retrieved, query) is not None
+                if rank is None:
+                    misses.append(text)
+                continue
+            stages['retrieve'].append(retrieved_at - start)
+            stages['rerank'].append(ranked_at - retrieved_at)
+            stages['combine'].append(combined_at - ranked_at)
+            stages['chain'].append(chained_at - combined_at)
+
+    return {
+        'config': config.to_dict(),
+        'queries': len(queries),
+        'k': config.rerank_top_n,
+        'recall_at_k': sum(rank is not None for rank in ranks) / len(queries),
+        'candidate_recall': candidate_hits / len(queries),
+        'mrr': sum(1 / rank for rank in ranks if rank) / len(queries),
+        'latency_ms': {stage: percentiles(samples) for stage, samples in stages.items() if samples},
+        'misses': misses
+    }
+
+
+def main():
+    args = parse_args()
+    for name in ('corpus', 'queries', 'output'):
+        setattr(args, name, os.path.abspath(getattr(args, name)))
+    if args.rerank_model:
+        args.rerank_model = os.path.abspath(args.rerank_model)
+    original_cwd = os.getcwd()
+
+    # Deterministic local embeddings and throwaway stores, nothing touches the app's data
+    os.environ['PAPERMIND_EMBEDDINGS'] = 'hashing'
+    os.environ['PAPERMIND_CHUNK_STORE'] = ':memory:'
+    os.environ['PAPERMIND_MESSAGE_STORE'] = ':memory:'
+    os.chdir(tempfile.mkdtemp(prefix='papermind-benchmark-'))
+    sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+    logging.basicConfig(level=logging.WARNING)
+
+    from langchain_core.runnables import RunnableLambda
+    from docflow import chunking
+    from docflow.chains import _chain_registry
+    from docflow.embeddings import HashingEmbeddings
+    from docflow.ingestion import File
+    from docflow.qa_engine import DocumentQA, ReRanker, VectorStore, RERANKER_MODEL_PATH
+    from docflow.retrieval import get_retrieval_config
+
+    if args.chunk_size:
+        chunking.CHUNK_SIZE = args.chunk_size
+    if args.chunk_overlap is not None:
+        chunking.CHUNK_OVERLAP = args.chunk_overlap
+    chunking.get_splitter.cache_clear()
+
+    # Retrieval never reaches the LLM, so the QA chain is a placeholder
+    _chain_registry.get('qa', lambda: RunnableLambda(lambda _: ''))
+
+    rerank_model = args.rerank_model or os.path.join(original_cwd, RERANKER_MODEL_PATH)
+    try:
+        re_ranker = _chain_registry.get('re_ranker', lambda: ReRanker(model_path=rerank_model))
+    except Exception as e:
+        print(f"Re-ranker unavailable ({e}), re-ranking profiles will truncate candidates instead.", file=sys.stderr)
+        re_ranker = None
+        _chain_registry.get('re_ranker', lambda: RunnableLambda(lambda inputs: inputs['retrieved'][:inputs.get('top_k') or 5]))
+
+    with open(args.queries, 'r', encoding='utf-8') as f:
+        queries = json.load(f)
+
+    sources = corpus_sources(args.corpus, File)
+    vector_store = VectorStore(collection_name='benchmark', embeddings=HashingEmbeddings())
+    _, ingest_report = ingest(sources, vector_store, re_ranker, File)
+
+    session = {
+        'session_id': SESSION_ID,
+        'upload_meta': {'count': len(sources), 'files': [File.source_metadata(source, 0) for source in sources]}
+    }
+    profiles = {}
+    for profile in args.profiles:
+        config = get_retrieval_config(profile)
+        doc_qa = DocumentQA(session, vector_store=vector_store, config=config)
+        profiles[profile] = evaluate(doc_qa, config, queries, args.repeat)
+        profiles[profile]['reranker'] = (rerank_model if re_ranker is not None else 'unavailable') if config.rerank else None
+
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'corpus': args.corpus,
+        'embeddings': 'hashing',
+        'chunk_size': chunking.CHUNK_SIZE,
+        'chunk_overlap': chunking.CHUNK_OVERLAP,
+        'ingest': ingest_report,
+        'profiles': profiles
+    }
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Ingested {ingest_report['chunks']} chunks at {ingest_report['chunks_per_second']:.1f} chunks/s")
+    for profile, result in profiles.items():
+        chain = result['latency_ms'].get('chain', {})
+        print(f"{profile:>8}: recall@{result['k']}={result['recall_at_k']:.2f} candidate_recall={result['candidate_recall']:.2f} "
+              f"mrr={result['mrr']:.2f} chain p50={chain.get('p50', 0):.1f}ms p95={chain.get('p95', 0):.1f}ms")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
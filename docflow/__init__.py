@@ -1 +1 @@
-__all__ = ["ingestion", "qa_engine", "prompts"]
\ No newline at end of file
+__all__ = ["ingestion", "qa_engine", "prompts", "models", "cache", "embeddings", "jobs", "pdf", "chunking", "generation", "chains", "store", "lexical", "retrieval", "fakes", "metrics"]
\ No newline at end of file
@@ -0,0 +1,406 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable
+import numpy as np
+import threading
+import hashlib
+import sqlite3
+import logging
+import json
+import time
+import os
+import re
+from .store import SQLiteStore, StoreError
+
+
+logger = logging.getLogger(__name__)
+
+
+class CacheError(Exception):
+    """Raised when cache operations fail"""
+    pass
+
+
+def content_hash(text: str, namespace: str = '') -> str:
+    """Stable hash of a piece of content, optionally scoped to a namespace"""
+    digest = hashlib.sha256()
+    if namespace:
+        digest.update(namespace.encode('utf-8'))
+        digest.update(b'\0')
+    digest.update(text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache with a bound on the number of entries"""
+
+    def __init__(self, max_items: int = 1024):
+        if max_items <= 0:
+            raise ValueError("max_items must be positive")
+        self.max_items = max_items
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def keys(self) -> list:
+        """Snapshot of the keys, least recently used first"""
+        with self._lock:
+            return list(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'items': len(self._data), 'max_items': self.max_items}
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class CacheBackend(ABC):
+    """Storage used by ResultCache"""
+
+    @abstractmethod
+    def get(self, key: str) -> Any:
+        """Value stored under key, or None when missing or expired"""
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: float = None) -> None:
+        """Store value under key, expiring after ttl seconds when given"""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+
+
+class MemoryBackend(CacheBackend):
+    """In-process LRU backend with per-entry expiry"""
+
+    def __init__(self, max_items: int = 256):
+        self._cache = LRUCache(max_items)
+
+    def get(self, key: str) -> Any:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at < time.time():
+            self._cache.pop(key)
+            return None
+        return value
+
+    def set(self, key: str, value: Any, ttl: float = None) -> None:
+        self._cache.put(key, (time.time() + ttl if ttl else None, value))
+
+    def delete(self, key: str) -> None:
+        self._cache.pop(key)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+class DiskBackend(CacheBackend):
+    """
+    JSON file per entry under a directory, shared by every process using it.
+    The least recently written entries are evicted beyond max_items.
+    """
+
+    def __init__(self, directory: str, max_items: int = 1024):
+        self.directory = directory
+        self.max_items = max_items
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Any:
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if entry['expires_at'] is not None and entry['expires_at'] < time.time():
+            self.delete(key)
+            return None
+        return entry['value']
+
+    def set(self, key: str, value: Any, ttl: float = None) -> None:
+        tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'expires_at': time.time() + ttl if ttl else None, 'value': value}, f)
+            os.replace(tmp_path, self._path(key))
+        except Exception as e:
+            logger.error(f"Failed to write cache entry {key}: {e}")
+            raise CacheError(f"Failed to write cache entry {key}: {e}")
+        self._evict()
+
+    def _evict(self):
+        entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.json')]
+        if len(entries) <= self.max_items:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_items]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self) -> None:
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                os.remove(entry.path)
+
+
+class ResultCache:
+    """Cache of generated results keyed by a hash of everything that determines them"""
+
+    def __init__(self, backend: CacheBackend = None, ttl: float = 3600):
+        self.backend = backend or MemoryBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Stable key from JSON-serialisable parts"""
+        return content_hash(json.dumps(parts, sort_keys=True, default=str))
+
+    def get(self, key: str) -> Any:
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Result cache lookup failed: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            logger.warning(f"Result cache write failed: {e}")
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class SemanticCache:
+    """
+    Values looked up by query embedding within a scope, such as one set of documents.
+    A lookup hits when the cosine similarity between the query and a stored query
+    reaches threshold, so vectors must be L2 normalised. Each scope keeps its
+    newest max_per_scope entries and the least recently used scopes are evicted
+    beyond max_scopes.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_per_scope: int = 128, max_scopes: int = 1024):
+        self.threshold = threshold
+        self.max_per_scope = max_per_scope
+        self._scopes = LRUCache(max_scopes)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, scope: Hashable, vector: np.ndarray) -> Any:
+        """Value of the most similar stored query in scope, or None below threshold"""
+        entry = self._scopes.get(scope)
+        if entry is not None:
+            vectors, values = entry
+            scores = vectors @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                self.hits += 1
+                logger.debug(f"Semantic cache hit with similarity {scores[best]}")
+                return values[best]
+        self.misses += 1
+        return None
+
+    def put(self, scope: Hashable, vector: np.ndarray, value: Any) -> None:
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            entry = self._scopes.get(scope)
+            vectors, values = entry if entry is not None else (np.empty((0, len(vector)), dtype=np.float32), [])
+            vectors = np.vstack([vectors, vector])[-self.max_per_scope:]
+            values = (values + [value])[-self.max_per_scope:]
+            self._scopes.put(scope, (vectors, values))
+
+    def clear(self) -> None:
+        self._scopes.clear()
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'scopes': len(self._scopes)}
+
+
+class VectorTable(SQLiteStore):
+    """Content-hash -> float32 vector rows, safe to share between processes"""
+    SCHEMA = ("""
+        CREATE TABLE IF NOT EXISTS vectors (
+            key TEXT PRIMARY KEY,
+            vector BLOB NOT NULL
+        )
+    """,)
+    _BATCH = 500
+
+    def get_many(self, keys: list[str]) -> dict[str, bytes]:
+        found = {}
+        connection = self._connect()
+        for i in range(0, len(keys), self._BATCH):
+            batch = keys[i:i + self._BATCH]
+            placeholders = ', '.join('?' * len(batch))
+            found.update(connection.execute(f"SELECT key, vector FROM vectors WHERE key IN ({placeholders})", batch).fetchall())
+        return found
+
+    def put_many(self, rows: list[tuple[str, bytes]]) -> None:
+        with self._connect() as connection:
+            connection.executemany("INSERT OR IGNORE INTO vectors VALUES (?, ?)", rows)
+
+    def count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+
+class EmbeddingCache:
+    """
+    Content-hash -> vector cache.
+    Vectors live in a bounded in-memory LRU in front of a SQLite table on disk
+    (vectors.db), so several worker processes can share one directory.
+    Without a directory the cache is memory only.
+    """
+
+    def __init__(self, dimensions: int, directory: str = None, max_items: int = 10000):
+        self.dimensions = dimensions
+        self.directory = directory
+        self._memory = LRUCache(max_items)
+        self._table: VectorTable = None
+
+        if self.directory:
+            try:
+                self._table = VectorTable(os.path.join(self.directory, 'vectors.db'))
+            except (StoreError, sqlite3.Error, OSError) as e:
+                logger.error(f"Failed to open embedding cache at {self.directory}: {e}")
+                raise CacheError(f"Failed to open embedding cache at {self.directory}: {e}")
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, np.ndarray]:
+        """Return the cached vectors for whichever keys are present"""
+        keys = list(keys)
+        found = {}
+        for key in keys:
+            vector = self._memory.get(key)
+            if vector is not None:
+                found[key] = vector
+
+        missing = [key for key in keys if key not in found]
+        if missing and self._table is not None:
+            try:
+                stored = self._table.get_many(missing)
+            except sqlite3.Error as e:
+                logger.warning(f"Embedding cache lookup failed: {e}")
+                stored = {}
+            for key, blob in stored.items():
+                vector = np.frombuffer(blob, dtype=np.float32)
+                if len(vector) != self.dimensions:
+                    logger.warning(f"Ignoring cached embedding {key} with {len(vector)} dimensions")
+                    continue
+                self._memory.put(key, vector)
+                found[key] = vector
+        return found
+
+    def put_many(self, items: dict[str, np.ndarray]) -> None:
+        """Store vectors in memory and on disk, keeping vectors already stored by any process"""
+        vectors = {key: np.asarray(vector, dtype=np.float32) for key, vector in items.items()}
+        for key, vector in vectors.items():
+            self._memory.put(key, vector)
+
+        if self._table is None or not vectors:
+            return
+        try:
+            self._table.put_many([(key, vector.tobytes()) for key, vector in vectors.items()])
+        except sqlite3.Error as e:
+            logger.error(f"Failed to persist {len(vectors)} embeddings: {e}")
+            raise CacheError(f"Failed to persist embeddings: {e}")
+
+    def __len__(self) -> int:
+        return self._table.count() if self._table is not None else len(self._memory)
+
+
+EMBEDDING_CACHE_DIR = 'EmbeddingCache'
+_embedding_caches: dict[tuple, EmbeddingCache] = {}
+_embedding_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model_path: str, dimensions: int, directory: str = None) -> EmbeddingCache:
+    """Process-wide embedding cache for one model, persisted under EMBEDDING_CACHE_DIR"""
+    key = (model_path, dimensions)
+    with _embedding_caches_lock:
+        if key not in _embedding_caches:
+            name = re.sub(r'[^A-Za-z0-9._-]+', '_', os.path.basename(model_path.replace('\\', '/')))
+            path = directory or os.path.join(EMBEDDING_CACHE_DIR, f"{name}-{dimensions}")
+            _embedding_caches[key] = EmbeddingCache(dimensions, directory=path)
+        return _embedding_caches[key]
+
+
+def get_result_cache(backend: str = None) -> ResultCache | None:
+    """
+    Result cache selected by backend or PAPERMIND_RESULT_CACHE: memory (default), disk or off.
+    Entries expire after PAPERMIND_RESULT_CACHE_TTL seconds.
+    """
+    backend = (backend or os.getenv('PAPERMIND_RESULT_CACHE', 'memory')).lower()
+    ttl = float(os.getenv('PAPERMIND_RESULT_CACHE_TTL', 3600))
+    if backend == 'off':
+        return None
+    if backend == 'disk':
+        return ResultCache(DiskBackend(os.getenv('PAPERMIND_RESULT_CACHE_DIR', 'ResultCache')), ttl=ttl)
+    if backend == 'memory':
+        return ResultCache(MemoryBackend(), ttl=ttl)
+    raise CacheError(f"Unknown result cache backend: {backend}")
+
+
+def get_answer_cache() -> SemanticCache | None:
+    """
+    Semantic answer cache, disabled with PAPERMIND_ANSWER_CACHE=off.
+    Queries within PAPERMIND_ANSWER_CACHE_THRESHOLD cosine similarity share an answer.
+    """
+    if os.getenv('PAPERMIND_ANSWER_CACHE', 'on').lower() == 'off':
+        return None
+    return SemanticCache(threshold=float(os.getenv('PAPERMIND_ANSWER_CACHE_THRESHOLD', 0.95)))
@@ -0,0 +1,97 @@
+from langchain_google_genai.chat_models import ChatGoogleGenerativeAI
+from langchain_core.language_models import BaseChatModel
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import Runnable, RunnableSequence
+from typing import Callable, Hashable
+import threading
+import logging
+from .prompts import Prompts
+from .fakes import FakeChatModel, load_test_enabled
+
+
+logger = logging.getLogger(__name__)
+
+
+class ChainRegistryError(Exception):
+    """Raised when an LLM client or chain can not be built"""
+    pass
+
+
+class ChainRegistry:
+    """
+    LLM clients and chains built once per process and shared by every request.
+    Reusing one client per model keeps its HTTP/gRPC connections to the model
+    endpoint alive across requests, so a request only pays for prompt
+    formatting and the call itself. With PAPERMIND_LOAD_TEST=1 every client
+    is a local FakeChatModel.
+    """
+
+    def __init__(self, model: str = "gemini-2.0-flash", temperature: float = 0.5):
+        self.model = model
+        self.temperature = temperature
+        self._llms: dict[tuple, BaseChatModel] = {}
+        self._chains: dict[Hashable, Runnable] = {}
+        self._lock = threading.Lock()
+        self._llm_locks: dict[tuple, threading.Lock] = {}
+        self._chain_locks: dict[Hashable, threading.Lock] = {}
+
+    def _get_or_build(self, cache: dict, locks: dict, key: Hashable, build: Callable[[], object]):
+        """
+        Value cached under key, built on first use. Built values are read without
+        locking; a build only holds the lock of its own key, so a slow build never
+        blocks requests for other clients or chains.
+        """
+        value = cache.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            lock = locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in cache:
+                cache[key] = build()
+            return cache[key]
+
+    def get_llm(self, model: str = None, temperature: float = None) -> BaseChatModel:
+        """Shared chat model client for a model and temperature"""
+        key = (model or self.model, self.temperature if temperature is None else temperature)
+
+        def build() -> BaseChatModel:
+            try:
+                if load_test_enabled():
+                    logger.warning(f'Load test mode, faking {key[0]} with temperature {key[1]}')
+                    return FakeChatModel.from_env(model=key[0], temperature=key[1])
+                logger.info(f'Initializing {key[0]} with temperature {key[1]}')
+                return ChatGoogleGenerativeAI(model=key[0], temperature=key[1])
+            except Exception as e:
+                logger.critical(f"{key[0]} Couldn't be initialized.", exc_info=True)
+                raise ChainRegistryError(f"{key[0]} Couldn't be initialized: {e}")
+
+        return self._get_or_build(self._llms, self._llm_locks, key, build)
+
+    def get(self, name: Hashable, builder: Callable[[], Runnable]) -> Runnable:
+        """Chain registered under name, built with builder on first use"""
+        def build() -> Runnable:
+            try:
+                chain = builder()
+                logger.info(f'Built chain {name}')
+                return chain
+            except ChainRegistryError:
+                raise
+            except Exception as e:
+                logger.error(f'Failed to build chain {name}: {e}')
+                raise ChainRegistryError(f'Failed to build chain {name}: {e}')
+
+        return self._get_or_build(self._chains, self._chain_locks, name, build)
+
+    @property
+    def qa_chain(self) -> RunnableSequence:
+        """Prompt -> Gemini -> string chain answering questions over retrieved context"""
+        return self.get('qa', lambda: RunnableSequence(Prompts.QAPrompt, self.get_llm(), StrOutputParser()))
+
+    @property
+    def summary_chain(self) -> RunnableSequence:
+        """Prompt -> Gemini -> string chain folding older chat messages into a running summary"""
+        return self.get('chat_summary', lambda: RunnableSequence(Prompts.ChatSummaryPrompt, self.get_llm(temperature=0), StrOutputParser()))
+
+
+_chain_registry = ChainRegistry()
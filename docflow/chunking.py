@@ -0,0 +1,96 @@
+from langchain.text_splitter import RecursiveCharacterTextSplitter, Language
+from functools import lru_cache
+from typing import Iterable, Iterator
+import logging
+import time
+import json
+from .metrics import observe
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024
+CHUNK_OVERLAP = 256
+SEPARATORS = ['\n\n', '\n', '.', '?', '!', ' ', '']
+
+
+@lru_cache(maxsize=None)
+def get_splitter(language: str = None) -> RecursiveCharacterTextSplitter:
+    """Shared splitter for a language (or plain text), built once per process"""
+    if language:
+        try:
+            splitter = RecursiveCharacterTextSplitter.from_language(Language(language), chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+            logger.debug(f"Splitter set for language: {language}")
+            return splitter
+        except ValueError:
+            logger.warning(f"No specific splitter for language: {language}, using default")
+    return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, separators=SEPARATORS)
+
+
+def iter_chunks(segments: Iterable[str], splitter: RecursiveCharacterTextSplitter, buffer_size: int = CHUNK_SIZE * 8) -> Iterator[str]:
+    """
+    Split a lazily produced stream of text segments (pages, cells, file blocks).
+    Segments are buffered until buffer_size characters, split, and every chunk but
+    the last is emitted; the last one is carried into the next buffer so chunks
+    spanning segment boundaries stay intact. Memory is bounded by the buffer
+    and the largest segment, not the whole document.
+    """
+    buffer = ''
+    seconds = 0.0
+    for segment in segments:
+        if not segment:
+            continue
+        buffer = f"{buffer}\n\n{segment}" if buffer else segment
+        if len(buffer) >= buffer_size:
+            start = time.perf_counter()
+            chunks = splitter.split_text(buffer)
+            seconds += time.perf_counter() - start
+            for chunk in chunks[:-1]:
+                yield chunk
+            buffer = chunks[-1] if chunks else ''
+
+    start = time.perf_counter()
+    chunks = splitter.split_text(buffer) if buffer.strip() else []
+    observe('split', seconds + time.perf_counter() - start)
+    yield from chunks
+
+
+def iter_text_file(path: str, block_size: int = 1 << 16) -> Iterator[str]:
+    """Read a text file in blocks, ending each block at a line break where possible"""
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        pending = ''
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            block = pending + block
+            cut = block.rfind('\n')
+            if cut == -1:
+                pending = block
+                continue
+            pending = block[cut + 1:]
+            yield block[:cut + 1]
+        if pending:
+            yield pending
+
+
+def iter_notebook_cells(path: str, include_outputs: bool = True, max_output_length: int = 30) -> Iterator[str]:
+    """Yield the cells of a Jupyter notebook formatted like NotebookLoader does"""
+    with open(path, 'r', encoding='utf-8') as f:
+        notebook = json.load(f)
+
+    for cell in notebook.get('cells', []):
+        cell_type = cell.get('cell_type', 'code')
+        source = ''.join(cell.get('source', []))
+        text = f"'{cell_type}' cell: '{source}'"
+
+        if include_outputs and cell_type == 'code' and cell.get('outputs'):
+            output = cell['outputs'][0]
+            if output.get('output_type') == 'error':
+                text += f"\n with error: '{output.get('ename')}: {output.get('evalue')}'"
+            else:
+                data = output.get('text') or output.get('data', {}).get('text/plain', '')
+                data = ''.join(data) if isinstance(data, list) else str(data)
+                text += f"\n with output: '{data[:max_output_length]}'"
+
+        yield text
@@ -0,0 +1,100 @@
+from langchain_core.embeddings import Embeddings
+from langchain_google_genai.embeddings import GoogleGenerativeAIEmbeddings
+from typing import Literal
+import numpy as np
+import hashlib
+import logging
+import os
+import re
+from .models import ModelRegistry, _model_registry
+
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingProviderError(Exception):
+    """Raised when an embedding provider can not be created"""
+    pass
+
+
+class SentenceTransformerEmbeddings(Embeddings):
+    """Local SentenceTransformer embeddings drawn from the shared model registry"""
+
+    def __init__(self, model_path: str, dimensions: int = None, device: str = None,
+                 batch_size: int = 32, registry: ModelRegistry = None):
+        self.model_path = model_path
+        self.dimensions = dimensions
+        self.batch_size = batch_size
+        self.model = (registry or _model_registry).get_sentence_transformer(model_path, truncate_dim=dimensions, device=device)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        vectors = self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True, normalize_embeddings=True)
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic feature-hashing embeddings.
+    Word unigrams and bigrams are hashed into a fixed number of signed buckets,
+    so texts sharing words stay similar without any model or network access.
+    Meant for tests, offline benchmarks and load tests.
+    """
+
+    def __init__(self, dimensions: int = 384):
+        self.dimensions = dimensions
+
+    @staticmethod
+    def tokenize(text: str) -> list[str]:
+        return re.findall(r'\w+', text.lower())
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        tokens = self.tokenize(text)
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+            value = int.from_bytes(digest, 'little')
+            vector[value % self.dimensions] += 1.0 if (value >> 63) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+LOCAL_EMBEDDING_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+
+
+def get_embeddings(provider: Literal["google", "local", "hashing", "fake"] = None) -> Embeddings:
+    """
+    Create the embedding backend selected by provider or the PAPERMIND_EMBEDDINGS
+    environment variable (google by default, fake when PAPERMIND_LOAD_TEST=1).
+    """
+    default = 'fake' if os.getenv('PAPERMIND_LOAD_TEST', '0') == '1' else 'google'
+    provider = (provider or os.getenv('PAPERMIND_EMBEDDINGS', default)).lower()
+    try:
+        if provider == 'google':
+            embeddings = GoogleGenerativeAIEmbeddings(model='models/text-embedding-004')
+        elif provider == 'local':
+            embeddings = SentenceTransformerEmbeddings(os.getenv('PAPERMIND_EMBEDDING_MODEL', LOCAL_EMBEDDING_MODEL))
+        elif provider == 'hashing':
+            embeddings = HashingEmbeddings()
+        elif provider == 'fake':
+            from .fakes import FakeEmbeddings
+            embeddings = FakeEmbeddings()
+        else:
+            raise ValueError(f"Unknown embedding provider: {provider}")
+    except Exception as e:
+        logger.critical(f"Failed to initialize {provider} embeddings: {e}")
+        raise EmbeddingProviderError(f"Failed to initialize {provider} embeddings: {e}")
+
+    logger.info(f"Initialized {provider} embeddings")
+    return embeddings
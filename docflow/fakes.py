@@ -0,0 +1,86 @@
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from typing import AsyncIterator, Iterator
+import asyncio
+import time
+import os
+import re
+from .embeddings import HashingEmbeddings
+
+
+def load_test_enabled() -> bool:
+    """Whether PAPERMIND_LOAD_TEST swaps Gemini and Google embeddings for local fakes"""
+    return os.getenv('PAPERMIND_LOAD_TEST', '0') == '1'
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Local stand-in for Gemini in load tests. Answers with response_tokens words
+    taken from the prompt, waiting latency seconds before the first token and
+    emitting tokens_per_second afterwards, so no quota is spent.
+    """
+    model: str = 'fake'
+    temperature: float = 0.0
+    latency: float = 0.5
+    tokens_per_second: float = 50.0
+    response_tokens: int = 200
+
+    @classmethod
+    def from_env(cls, model: str = 'fake', temperature: float = 0.0) -> "FakeChatModel":
+        return cls(model=model,
+                   temperature=temperature,
+                   latency=float(os.getenv('PAPERMIND_FAKE_LLM_LATENCY', 0.5)),
+                   tokens_per_second=float(os.getenv('PAPERMIND_FAKE_LLM_TOKENS_PER_SECOND', 50)),
+                   response_tokens=int(os.getenv('PAPERMIND_FAKE_LLM_TOKENS', 200)))
+
+    @property
+    def _llm_type(self) -> str:
+        return 'fake-chat'
+
+    def _tokens(self, messages: list[BaseMessage]) -> list[str]:
+        words = re.findall(r'\w+', ' '.join(str(message.content) for message in messages))[-64:] or ['answer']
+        return [f"{words[i % len(words)]} " for i in range(self.response_tokens)]
+
+    def _generate(self, messages: list[BaseMessage], stop: list[str] = None,
+                  run_manager: CallbackManagerForLLMRun = None, **kwargs) -> ChatResult:
+        tokens = self._tokens(messages)
+        time.sleep(self.latency + len(tokens) / self.tokens_per_second)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=''.join(tokens)))])
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: list[str] = None,
+                         run_manager: AsyncCallbackManagerForLLMRun = None, **kwargs) -> ChatResult:
+        tokens = self._tokens(messages)
+        await asyncio.sleep(self.latency + len(tokens) / self.tokens_per_second)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=''.join(tokens)))])
+
+    def _stream(self, messages: list[BaseMessage], stop: list[str] = None,
+                run_manager: CallbackManagerForLLMRun = None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for token in self._tokens(messages):
+            time.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages: list[BaseMessage], stop: list[str] = None,
+                       run_manager: AsyncCallbackManagerForLLMRun = None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for token in self._tokens(messages):
+            await asyncio.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+class FakeEmbeddings(HashingEmbeddings):
+    """Hashing embeddings that also wait latency seconds per call, like a remote embedding API"""
+
+    def __init__(self, dimensions: int = 384, latency: float = None):
+        super().__init__(dimensions)
+        self.latency = float(os.getenv('PAPERMIND_FAKE_EMBED_LATENCY', 0.05)) if latency is None else latency
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        time.sleep(self.latency)
+        return super().embed_query(text)
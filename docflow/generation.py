@@ -0,0 +1,204 @@
+from langchain_core.language_models import BaseChatModel
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+from langchain_core.runnables import RunnableSequence
+from typing import Iterator
+import logging
+from .prompts import Prompts
+from .cache import ResultCache, content_hash
+from .metrics import span, timed
+
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationError(Exception):
+    """Raised when study material can not be generated"""
+    pass
+
+
+MODE_TASKS = {
+    'summarise': 'a summary',
+    'faq': 'a list of frequently asked questions',
+    'guide': 'a study guide',
+    'timeline': 'a timeline',
+    'map': 'a mind map'
+}
+
+
+class MapReduceGenerator:
+    """
+    Generates study material over any number of sources with bounded prompts.
+    Chunks are grouped per source into groups of at most group_chars, each group
+    is condensed into notes by concurrent map calls, notes are merged by
+    hierarchical reduce calls until they fit in reduce_chars, and the mode's
+    prompt runs once over the result. Corpora that already fit in reduce_chars
+    go straight to the mode's prompt.
+    """
+
+    def __init__(self, llm: BaseChatModel, prompts: dict[str, PromptTemplate] = None,
+                 max_concurrency: int = 8, group_chars: int = 16000, reduce_chars: int = 32000,
+                 cache: ResultCache = None):
+        parser = StrOutputParser()
+        self.llm = llm
+        self.cache = cache
+        self.prompts = prompts or {
+            'summarise': Prompts.SummaryPrompt,
+            'faq': Prompts.FAQPrompt,
+            'guide': Prompts.GuidePrompt,
+            'timeline': Prompts.TimelinePrompt,
+            'map': Prompts.MindMapPrompt
+        }
+        self.chains = {mode: RunnableSequence(prompt, llm, parser) for mode, prompt in self.prompts.items()}
+        self.map_chain = RunnableSequence(Prompts.MapPrompt, llm, parser)
+        self.combine_chain = RunnableSequence(Prompts.CombinePrompt, llm, parser)
+        self.max_concurrency = max_concurrency
+        self.group_chars = group_chars
+        self.reduce_chars = reduce_chars
+
+    @property
+    def modes(self) -> list[str]:
+        return list(self.chains)
+
+    def group_chunks(self, chunks: list[dict]) -> list[dict]:
+        """Group chunk text per source, in upload order, into groups of at most group_chars"""
+        groups = []
+        current = {}
+        for chunk in chunks:
+            metadata = chunk.get('metadata', {})
+            doc_id = metadata.get('doc_id')
+            text = chunk.get('text', '')
+            if not text.strip():
+                continue
+            if current and (current['doc_id'] != doc_id or len(current['text']) + len(text) > self.group_chars):
+                groups.append(current)
+                current = {}
+            if not current:
+                current = {'doc_id': doc_id, 'name': metadata.get('name', 'Unknown'), 'text': text}
+            else:
+                current['text'] += f"\n{text}"
+        if current:
+            groups.append(current)
+        return groups
+
+    @staticmethod
+    def format_groups(groups: list[dict]) -> str:
+        return "\n\n".join(f"Source: {group['name']}\n{group['text']}" for group in groups)
+
+    def _pack(self, parts: list[str]) -> list[str]:
+        """Concatenate parts into batches of at most reduce_chars"""
+        batches, current = [], ''
+        for part in parts:
+            if current and len(current) + len(part) > self.reduce_chars:
+                batches.append(current)
+                current = ''
+            current = f"{current}\n\n{part}" if current else part
+        if current:
+            batches.append(current)
+        return batches
+
+    def map(self, mode: str, groups: list[dict]) -> list[str]:
+        """Condense every group into notes with concurrent calls"""
+        inputs = [{'task': MODE_TASKS.get(mode, mode), 'name': group['name'], 'text': group['text']} for group in groups]
+        notes = self.map_chain.batch(inputs, config={'max_concurrency': self.max_concurrency})
+        return [f"Source: {group['name']}\n{note}" for group, note in zip(groups, notes)]
+
+    def reduce(self, mode: str, notes: list[str]) -> str:
+        """Merge notes hierarchically until they fit in one prompt"""
+        level = 0
+        while sum(len(note) for note in notes) > self.reduce_chars and len(notes) > 1:
+            batches = self._pack(notes)
+            if len(batches) == len(notes):
+                batches = [f"{a}\n\n{b}" for a, b in zip(batches[::2], batches[1::2])] + ([batches[-1]] if len(batches) % 2 else [])
+            inputs = [{'task': MODE_TASKS.get(mode, mode), 'text': batch} for batch in batches]
+            notes = self.combine_chain.batch(inputs, config={'max_concurrency': self.max_concurrency})
+            level += 1
+            logger.debug(f"Reduce level {level} produced {len(notes)} note(s).")
+        return "\n\n".join(notes)
+
+    def prepare(self, mode: str, chunks: list[dict]) -> str:
+        """Build the text the mode's prompt will run over, mapping and reducing if needed"""
+        groups = self.group_chunks(chunks)
+        if not groups:
+            raise GenerationError("No text to generate from.")
+
+        text = self.format_groups(groups)
+        if len(text) <= self.reduce_chars:
+            return text
+
+        with span('llm_map', mode=mode, groups=len(groups)) as timer:
+            notes = self.map(mode, groups)
+        logger.info(f"Mapped {len(groups)} chunk group(s) for {mode} in {timer.seconds} seconds.")
+
+        with span('llm_reduce', mode=mode, notes=len(notes)) as timer:
+            text = self.reduce(mode, notes)
+        logger.info(f"Reduced {len(notes)} note(s) for {mode} in {timer.seconds} seconds.")
+        return text
+
+    def prompt_version(self, mode: str) -> str:
+        """Hash of every prompt and budget that shapes the output of a mode"""
+        templates = [self.prompts[mode].template, Prompts.MapPrompt.template, Prompts.CombinePrompt.template]
+        return content_hash('\0'.join(templates), namespace=f"{self.group_chars}:{self.reduce_chars}")
+
+    def cache_key(self, mode: str, chunks: list[dict]) -> str:
+        """Key of a result: mode, prompt version, the set of sources and the model parameters"""
+        sources = sorted({chunk.get('metadata', {}).get('doc_id', '') for chunk in chunks})
+        params = {'model': getattr(self.llm, 'model', None), 'temperature': getattr(self.llm, 'temperature', None)}
+        return ResultCache.make_key(mode, self.prompt_version(mode), sources, params)
+
+    def invoke(self, mode: str, chunks: list[dict]) -> str:
+        """Generate the study material for mode over the uploaded chunks"""
+        if mode not in self.chains:
+            raise GenerationError(f"Unknown mode: {mode}")
+
+        key = self.cache_key(mode, chunks) if self.cache else None
+        if key:
+            cached = self.cache.get(key)
+            if cached is not None:
+                logger.info(f"Serving {mode} from the result cache.")
+                return cached
+
+        try:
+            text = self.prepare(mode, chunks)
+            with span('llm', mode=mode):
+                result = self.chains[mode].invoke({'text': text})
+            if key and result:
+                self.cache.put(key, result)
+            return result
+        except GenerationError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to generate {mode}: {e}")
+            raise GenerationError(f"Failed to generate {mode}: {e}")
+
+    def stream(self, mode: str, chunks: list[dict]) -> Iterator[str]:
+        """
+        Stream the study material for mode token by token.
+        Map and reduce calls complete first, only the final prompt is streamed.
+        """
+        if mode not in self.chains:
+            raise GenerationError(f"Unknown mode: {mode}")
+
+        key = self.cache_key(mode, chunks) if self.cache else None
+        if key:
+            cached = self.cache.get(key)
+            if cached is not None:
+                logger.info(f"Serving {mode} from the result cache.")
+                yield cached
+                return
+
+        try:
+            text = self.prepare(mode, chunks)
+            parts = []
+            for token in timed(self.chains[mode].stream({'text': text}), 'llm', mode=mode, streamed=True):
+                parts.append(token)
+                yield token
+        except GenerationError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to generate {mode}: {e}")
+            raise GenerationError(f"Failed to generate {mode}: {e}")
+
+        result = ''.join(parts)
+        if key and result:
+            self.cache.put(key, result)
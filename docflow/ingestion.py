@@ -1,216 +1,221 @@
 import os
 from flask import Flask
 from werkzeug.utils import secure_filename
-from langchain_community.document_loaders import PyMuPDFLoader, TextLoader, WebBaseLoader
-from langchain_community.document_loaders.notebook import NotebookLoader
-from langchain_community.document_loaders import TextLoader
-from langchain_community.document_loaders.parsers import RapidOCRBlobParser
+from langchain_community.document_loaders import WebBaseLoader
 from langchain_community.document_loaders.youtube import YoutubeLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from typing import Iterator
 import validators
+import hashlib
+import uuid
 import logging
 import re
+from .pdf import PDFExtractor
+from .chunking import get_splitter, iter_chunks, iter_text_file, iter_notebook_cells
+from .metrics import span, timed
 
 logger = logging.getLogger(__name__)
 
+_pdf_extractor = PDFExtractor(max_workers=int(os.getenv('PAPERMIND_PDF_WORKERS', os.cpu_count() or 1)))
+
 
 class File():
-    def __init__(self, app):
-        self.SUPPORTED_FILE_TYPES = {
-            "cpp": "cpp",
-            "cc": "cpp",
-            "cxx": "cpp",
-            "hpp": "cpp",
-            "h": "cpp",
+    SUPPORTED_FILE_TYPES = {
+        "cpp": "cpp",
+        "cc": "cpp",
+        "cxx": "cpp",
+        "hpp": "cpp",
+        "h": "cpp",
 
-            "go": "go",
+        "go": "go",
 
-            "java": "java",
+        "java": "java",
 
-            "kt": "kotlin",
-            "kts": "kotlin",
+        "kt": "kotlin",
+        "kts": "kotlin",
 
-            "js": "js",
-            "mjs": "js",
-            "cjs": "js",
+        "js": "js",
+        "mjs": "js",
+        "cjs": "js",
 
-            "ts": "ts",
-            "tsx": "ts",
+        "ts": "ts",
+        "tsx": "ts",
 
-            "php": "php",
-            "phtml": "php",
-            "php3": "php",
-            "php4": "php",
+        "php": "php",
+        "phtml": "php",
+        "php3": "php",
+        "php4": "php",
 
-            "proto": "proto",
+        "proto": "proto",
 
-            "py": "python",
-            "pyw": "python",
+        "py": "python",
+        "pyw": "python",
 
-            "ipynb": "notebook",
+        "ipynb": "notebook",
 
-            "rst": "rst",
+        "rst": "rst",
 
-            "rb": "ruby",
-            "erb": "ruby",
+        "rb": "ruby",
+        "erb": "ruby",
 
-            "rs": "rust",
+        "rs": "rust",
 
-            "scala": "scala",
-            "sc": "scala",
+        "scala": "scala",
+        "sc": "scala",
 
-            "swift": "swift",
+        "swift": "swift",
 
-            "md": "markdown",
-            "markdown": "markdown",
+        "md": "markdown",
+        "markdown": "markdown",
 
-            "tex": "latex",
-            "ltx": "latex",
-            "latex": "latex",
+        "tex": "latex",
+        "ltx": "latex",
+        "latex": "latex",
 
-            "html": "html",
-            "htm": "html",
+        "html": "html",
+        "htm": "html",
 
-            "sol": "sol",
+        "sol": "sol",
 
-            "cs": "csharp",
+        "cs": "csharp",
 
-            "cob": "cobol",
-            "cbl": "cobol",
-            "cpy": "cobol",
+        "cob": "cobol",
+        "cbl": "cobol",
+        "cpy": "cobol",
 
-            "c": "c",
+        "c": "c",
 
-            "lua": "lua",
+        "lua": "lua",
 
-            "pl": "perl",
-            "pm": "perl",
-            "t": "perl",
-            "pod": "perl",
+        "pl": "perl",
+        "pm": "perl",
+        "t": "perl",
+        "pod": "perl",
 
-            "hs": "haskell",
-            "lhs": "haskell",
+        "hs": "haskell",
+        "lhs": "haskell",
 
-            "ex": "elixir",
-            "exs": "elixir",
+        "ex": "elixir",
+        "exs": "elixir",
 
-            "ps1": "powershell",
-            "psm1": "powershell",
-            "psd1": "powershell",
+        "ps1": "powershell",
+        "psm1": "powershell",
+        "psd1": "powershell",
 
-            "txt": "text",
+        "txt": "text",
 
-            "pdf": "pdf"
-        }
-        
-        self.EXTENSION_TO_MIME = {
-            # C-family
-            "c": "text/x-c",
-            "cpp": "text/x-c++",
-            "cc": "text/x-c++",
-            "cxx": "text/x-c++",
-            "h": "text/x-c",
-            "hpp": "text/x-c++",
-
-            # Go
-            "go": "text/x-go",
-
-            # Java/Kotlin
-            "java": "text/x-java-source",
-            "kt": "text/x-kotlin",
-            "kts": "text/x-kotlin",
-
-            # JavaScript/TypeScript
-            "js": "application/javascript",
-            "mjs": "application/javascript",
-            "cjs": "application/javascript",
-            "ts": "application/typescript",
-            "tsx": "application/typescript",
-
-            # PHP
-            "php": "application/x-httpd-php",
-            "phtml": "application/x-httpd-php",
-            "php3": "application/x-httpd-php",
-            "php4": "application/x-httpd-php",
-
-            # Protobuf
-            "proto": "text/plain",
-
-            # Python
-            "py": "text/x-python",
-            "pyw": "text/x-python",
-
-            # Jupyter Notebook
-            "ipynb": "application/x-ipynb+json",
-
-            # Markdown / reStructuredText
-            "md": "text/markdown",
-            "markdown": "text/markdown",
-            "rst": "text/x-rst",
-
-            # Ruby
-            "rb": "text/x-ruby",
-            "erb": "text/x-ruby",
-
-            # Rust
-            "rs": "text/x-rustsrc",
-
-            # Scala
-            "scala": "text/x-scala",
-            "sc": "text/x-scala",
-
-            # Swift
-            "swift": "text/x-swift",
-
-            # LaTeX
-            "tex": "application/x-tex",
-            "ltx": "application/x-tex",
-            "latex": "application/x-latex",
-
-            # HTML
-            "html": "text/html",
-            "htm": "text/html",
-
-            # Solidity
-            "sol": "text/plain",  # unofficial
-
-            # C#
-            "cs": "text/plain",  # could be "text/x-csharp" unofficially
-
-            # COBOL
-            "cob": "text/plain",
-            "cbl": "text/plain",
-            "cpy": "text/plain",
-
-            # Lua
-            "lua": "text/x-lua",
-
-            # Perl
-            "pl": "text/x-perl",
-            "pm": "text/x-perl",
-            "t": "text/x-perl",
-            "pod": "text/x-perl",
-
-            # Haskell
-            "hs": "text/x-haskell",
-            "lhs": "text/x-haskell",
-
-            # Elixir
-            "ex": "text/x-elixir",
-            "exs": "text/x-elixir",
-
-            # PowerShell
-            "ps1": "text/x-powershell",
-            "psm1": "text/x-powershell",
-            "psd1": "text/x-powershell",
-
-            # General text
-            "txt": "text/plain",
-
-            # PDF
-            "pdf": "application/pdf",
-        }
+        "pdf": "pdf"
+    }
+    
+    EXTENSION_TO_MIME = {
+        # C-family
+        "c": "text/x-c",
+        "cpp": "text/x-c++",
+        "cc": "text/x-c++",
+        "cxx": "text/x-c++",
+        "h": "text/x-c",
+        "hpp": "text/x-c++",
+
+        # Go
+        "go": "text/x-go",
+
+        # Java/Kotlin
+        "java": "text/x-java-source",
+        "kt": "text/x-kotlin",
+        "kts": "text/x-kotlin",
+
+        # JavaScript/TypeScript
+        "js": "application/javascript",
+        "mjs": "application/javascript",
+        "cjs": "application/javascript",
+        "ts": "application/typescript",
+        "tsx": "application/typescript",
+
+        # PHP
+        "php": "application/x-httpd-php",
+        "phtml": "application/x-httpd-php",
+        "php3": "application/x-httpd-php",
+        "php4": "application/x-httpd-php",
+
+        # Protobuf
+        "proto": "text/plain",
+
+        # Python
+        "py": "text/x-python",
+        "pyw": "text/x-python",
+
+        # Jupyter Notebook
+        "ipynb": "application/x-ipynb+json",
+
+        # Markdown / reStructuredText
+        "md": "text/markdown",
+        "markdown": "text/markdown",
+        "rst": "text/x-rst",
+
+        # Ruby
+        "rb": "text/x-ruby",
+        "erb": "text/x-ruby",
+
+        # Rust
+        "rs": "text/x-rustsrc",
+
+        # Scala
+        "scala": "text/x-scala",
+        "sc": "text/x-scala",
+
+        # Swift
+        "swift": "text/x-swift",
+
+        # LaTeX
+        "tex": "application/x-tex",
+        "ltx": "application/x-tex",
+        "latex": "application/x-latex",
+
+        # HTML
+        "html": "text/html",
+        "htm": "text/html",
+
+        # Solidity
+        "sol": "text/plain",  # unofficial
+
+        # C#
+        "cs": "text/plain",  # could be "text/x-csharp" unofficially
+
+        # COBOL
+        "cob": "text/plain",
+        "cbl": "text/plain",
+        "cpy": "text/plain",
+
+        # Lua
+        "lua": "text/x-lua",
+
+        # Perl
+        "pl": "text/x-perl",
+        "pm": "text/x-perl",
+        "t": "text/x-perl",
+        "pod": "text/x-perl",
+
+        # Haskell
+        "hs": "text/x-haskell",
+        "lhs": "text/x-haskell",
+
+        # Elixir
+        "ex": "text/x-elixir",
+        "exs": "text/x-elixir",
+
+        # PowerShell
+        "ps1": "text/x-powershell",
+        "psm1": "text/x-powershell",
+        "psd1": "text/x-powershell",
+
+        # General text
+        "txt": "text/plain",
+
+        # PDF
+        "pdf": "application/pdf",
+    }
 
+    def __init__(self, app):
         if isinstance(app, Flask):
             self.app = app
         else:
@@ -241,26 +246,37 @@ class File():
         
         return True, ext
 
-    def file_save(self, file, expected_type) -> tuple[str | None, str, str | None]:
-        """Save uploaded file with proper validation"""
+    def file_save(self, file, expected_type, upload_id: str) -> tuple[str | None, str, str | None, str | None]:
+        """
+        Save uploaded file with proper validation to a path of its own under the upload's
+        directory, so uploads of the same filename never overwrite each other. The bytes
+        are hashed as they are written, so the returned hash is that of the saved file.
+        """
         if not file or file.filename == '':
-            return None, "No file selected", None
+            return None, "No file selected", None, None
         
         is_valid, result = self.validate_file_type(file.filename, expected_type)
         if not is_valid:
-            return None, result, None
+            return None, result, None, None
         
         ext = result
         secure_name = secure_filename(file.filename)
-        file_path = os.path.join(self.app.config['UPLOAD_FOLDER'], secure_name)
+        upload_dir = os.path.join(self.app.config['UPLOAD_FOLDER'], upload_id)
+        file_path = os.path.join(upload_dir, f"{uuid.uuid4().hex}_{secure_name}")
         
         try:
             logger.info(f"Saving file to: {file_path}")
-            file.save(file_path)
-            return file_path, ext, file.filename
+            os.makedirs(upload_dir, exist_ok=True)
+            digest = self.content_digest(expected_type, ext)
+            with open(file_path, 'xb') as f:
+                for block in iter(lambda: file.stream.read(1 << 20), b''):
+                    digest.update(block)
+                    f.write(block)
+            return file_path, ext, file.filename, digest.hexdigest()
         except Exception as e:
             logger.exception(f"Failed to save file: {str(e)}")
-            return None, f"Failed to save file: {str(e)}", None
+            self.discard({'path': file_path})
+            return None, f"Failed to save file: {str(e)}", None, None
 
     @staticmethod
     def validate_url(url: str) -> tuple[bool, str]:
@@ -298,68 +314,129 @@ class File():
         return is_yt, video_id
 
 
-    def file_loader(self, file_type: str, request, group_id: int, upload_time: float)-> tuple[list[str], dict]:
-        logger.info(f"Loading file type: {file_type} for group: {group_id}")
-        content = ''
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1024, chunk_overlap=256, separators=['\n\n', '\n', '.', '?', '!', ' ', ''])
-        ext = None
+    def prepare_source(self, file_type: str, request, group_id: int, upload_id: str) -> dict:
+        """
+        Capture everything needed to load a source from the request,
+        saving uploaded files under upload_id, so loading can happen outside the request.
+        """
+        source = {'group_id': group_id, 'file_type': file_type, 'path': None, 'ext': None, 'name': None, 'text': None}
+
+        if file_type in ('text', 'pdf', 'code'):
+            with span('file_save', file_type=file_type):
+                file_path, ext, filename, file_hash = self.file_save(request.files.get(f'file_{group_id}'), file_type, upload_id)
+            if file_path is None:
+                raise ValueError(ext)
+            source.update({'path': file_path, 'ext': ext, 'name': filename, 'hash': file_hash})
+
+        elif file_type == 'link':
+            url = request.form.get(f'url_{group_id}', '').strip()
+            is_valid, validated_url = self.validate_url(url)
+            if not is_valid:
+                raise ValueError(validated_url)
+            source.update({'url': validated_url, 'name': validated_url})
+            source['hash'] = self.source_hash(source)
+
+        elif file_type == 'pasted':
+            content = request.form.get(f'pasted_{group_id}', '').strip()
+            if not content:
+                raise ValueError("No text was pasted")
+            source.update({'text': content, 'name': 'Pasted Text'})
+            source['hash'] = self.source_hash(source)
 
+        else:
+            raise ValueError(f"Unsupported file type: {file_type}")
+
+        return source
+
+    @staticmethod
+    def discard(source: dict) -> None:
+        """Delete a source's saved upload, and its upload directory once empty"""
+        if not source.get('path'):
+            return
         try:
-            if file_type == 'text':
-                file_path, ext, filename = self.file_save(request.files.get(f'file_{group_id}'), 'text')
-                loader = TextLoader(file_path)
-
-            elif file_type == 'pdf':
-                file_path, ext, filename = self.file_save(request.files.get(f'file_{group_id}'), 'pdf')
-                loader = PyMuPDFLoader(file_path, mode="page", images_inner_format="text", images_parser=RapidOCRBlobParser())
-
-            elif file_type == 'code':
-                file_path, ext, filename = self.file_save(request.files.get(f'file_{group_id}'), 'code')
-                if ext != 'ipynb':
-                    loader = TextLoader(file_path)
-                    try:
-                        splitter = splitter.from_language(self.SUPPORTED_FILE_TYPES[ext])
-                        logger.debug(f"Splitter set for language: {self.SUPPORTED_FILE_TYPES[ext]}")
-                    except Exception as e:
-                        logger.warning(f"No specific splitter for language: {ext}, using default")
-                else:
-                    loader = NotebookLoader(file_path, include_outputs=True, max_output_length=30)
-
-            elif file_type == 'link':
-                url = request.form.get(f'url_{group_id}', '').strip()
-                is_valid, validated_url = self.validate_url(url)
-                is_yt, video_id = self.check_yt(validated_url)
-                if not is_valid:
-                    raise ValueError(validated_url)
-                
-                loader = YoutubeLoader(video_id).from_youtube_url(validated_url) if is_yt else WebBaseLoader(validated_url)
+            os.remove(source['path'])
+            os.rmdir(os.path.dirname(source['path']))
+        except OSError:
+            # Already removed, or other files of the same upload are still there
+            pass
 
-            elif file_type == 'pasted':
-                content = request.form.get(f'pasted_{group_id}', '').strip()
-                if not content:
-                    raise ValueError("No text was pasted")
-                logger.debug("Pasted content received.")
+    @staticmethod
+    def content_digest(file_type: str, ext: str | None):
+        """sha256 of a source's content, seeded with its type so equal bytes loaded differently differ"""
+        return hashlib.sha256(f"{file_type}:{ext}\0".encode('utf-8'))
+
+    @classmethod
+    def source_hash(cls, source: dict) -> str:
+        """
+        Content address of a source: its file bytes, normalised URL or pasted text.
+        Uploads are hashed by file_save instead, as they are written.
+        """
+        digest = cls.content_digest(source['file_type'], source.get('ext'))
+        if source.get('path'):
+            with open(source['path'], 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+        elif source.get('url'):
+            digest.update(source['url'].rstrip('/').encode('utf-8'))
+        else:
+            digest.update((source.get('text') or '').encode('utf-8'))
+        return digest.hexdigest()
 
-            if file_type != 'pasted':
-                content += loader.load()[0].page_content
+    @classmethod
+    def iter_segments(cls, source: dict) -> Iterator[str]:
+        """Lazily yield the text of a source page by page, cell by cell or block by block"""
+        file_type = source['file_type']
+        file_path = source.get('path')
 
-        except Exception as e:
-            logger.exception(f"Could not load content: {str(e)}")
-            raise ValueError(f"Could not load content: {str(e)}")
-            
-        if not content.strip():
-            logger.error("Empty or unreadable content in uploaded source.")
-            raise ValueError("The source appears to be empty or contains no readable content")
-        
-        chunks = splitter.split_text(content)
-        logger.info(f"Split content into {len(chunks)} chunks.")
+        if file_type == 'text':
+            yield from iter_text_file(file_path)
 
-        t =  self.EXTENSION_TO_MIME.get(ext, 'text/plain')
-        metadata = {'name': filename, 'type': t, 'uploaded_at': upload_time, 'doc_id': f"doc_{group_id}_{upload_time}"}
+        elif file_type == 'pdf':
+            for page in _pdf_extractor.lazy_extract(file_path):
+                yield page['text']
 
-        chunks_with_metadata = [
-        {'text': chunk, 'metadata': {**metadata, 'chunk_id': i}} 
-        for i, chunk in enumerate(chunks)
-        ]
+        elif file_type == 'code':
+            if source.get('ext') != 'ipynb':
+                yield from iter_text_file(file_path)
+            else:
+                yield from iter_notebook_cells(file_path, include_outputs=True, max_output_length=30)
+
+        elif file_type == 'link':
+            url = source['url']
+            is_yt, video_id = cls.check_yt(url)
+            loader = YoutubeLoader(video_id).from_youtube_url(url) if is_yt else WebBaseLoader(url)
+            for document in loader.lazy_load():
+                yield document.page_content
+
+        elif file_type == 'pasted':
+            logger.debug("Pasted content received.")
+            yield source['text']
+
+    @classmethod
+    def splitter_for(cls, source: dict) -> RecursiveCharacterTextSplitter:
+        """Precompiled splitter matching the source's language"""
+        ext = source.get('ext')
+        if source['file_type'] == 'code' and ext != 'ipynb':
+            return get_splitter(cls.SUPPORTED_FILE_TYPES.get(ext))
+        return get_splitter()
+
+    @classmethod
+    def source_metadata(cls, source: dict, upload_time: float) -> dict:
+        t =  cls.EXTENSION_TO_MIME.get(source.get('ext'), 'text/plain')
+        doc_id = f"doc_{source['hash'][:16]}" if source.get('hash') else f"doc_{source['group_id']}_{upload_time}"
+        return {'name': source['name'], 'type': t, 'uploaded_at': upload_time, 'doc_id': doc_id}
+
+    @classmethod
+    def iter_chunks(cls, source: dict, upload_time: float) -> Iterator[dict]:
+        """Stream the chunks of a source with their metadata, never holding the whole document"""
+        logger.info(f"Loading file type: {source['file_type']} for group: {source['group_id']}")
+        metadata = cls.source_metadata(source, upload_time)
 
-        return chunks_with_metadata, metadata
\ No newline at end of file
+        try:
+            segments = timed(cls.iter_segments(source), 'load', file_type=source['file_type'])
+            chunks = iter_chunks(segments, cls.splitter_for(source))
+            for i, chunk in enumerate(chunks):
+                yield {'text': chunk, 'metadata': {**metadata, 'chunk_id': i}}
+        except Exception as e:
+            logger.exception(f"Could not load content: {str(e)}")
+            raise ValueError(f"Could not load content: {str(e)}")
@@ -0,0 +1,297 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+import contextvars
+import threading
+import queue
+import logging
+import secrets
+import time
+from .ingestion import File
+from .qa_engine import VectorStore, ReRanker
+from .store import ChunkStore, JobStore, StoreError, get_chunk_store, get_job_store
+from .chains import _chain_registry
+from .metrics import get_request_id, set_request_id
+
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionJob:
+    """Progress and results of one background upload"""
+
+    def __init__(self, session_id: str, sources: list[dict], upload_time: float, job_id: str = None):
+        self.id = job_id or secrets.token_hex(8)
+        self.request_id = get_request_id()
+        self.session_id = session_id
+        self.sources = sources
+        self.total = len(sources)
+        self.upload_time = upload_time
+        self.status = 'queued'
+        self.processed = 0
+        self.chunk_count = 0
+        self.files: list[dict] = []
+        self.uploaded: list[str] = []
+        self.failed: list[str] = []
+        self.errors: list[str] = []
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @classmethod
+    def from_row(cls, row: dict) -> 'IngestionJob':
+        """A finished or running job as last saved to the job store"""
+        job = cls.__new__(cls)
+        job.__dict__.update(row, request_id=None, sources=[], upload_time=None)
+        return job
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('completed', 'failed')
+
+    def to_row(self) -> dict:
+        return {'id': self.id, 'session_id': self.session_id, 'status': self.status, 'total': self.total,
+                'processed': self.processed, 'chunk_count': self.chunk_count,
+                'files': self.files, 'uploaded': self.uploaded, 'failed': self.failed, 'errors': self.errors,
+                'created_at': self.created_at, 'finished_at': self.finished_at}
+
+    def to_dict(self) -> dict:
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'total': self.total,
+            'processed': self.processed,
+            'chunks': self.chunk_count,
+            'files': [file['name'] for file in self.files],
+            'errors': self.errors
+        }
+
+
+class IngestionQueue:
+    """
+    Bounded worker pool that loads, splits and indexes uploaded sources
+    outside the request so /upload can return immediately. Job state is
+    saved to a JobStore so any worker process can look a job up.
+    """
+
+    def __init__(self, files: File, vector_store: VectorStore, max_workers: int = 2,
+                 precompute_rerank: bool = True, retention: float = 3600,
+                 loader_threads: int = 8, batch_size: int = 256, max_pending_batches: int = 4, link_ttl: float = 3600,
+                 chunk_store: ChunkStore = None, job_store: JobStore = None):
+        self.files = files
+        self.vector_store = vector_store
+        self._chunk_store = chunk_store
+        self._job_store = job_store
+        self.precompute_rerank = precompute_rerank
+        self.retention = retention
+        self.batch_size = batch_size
+        self.max_pending_batches = max_pending_batches
+        self.link_ttl = link_ttl
+        self._jobs: dict[str, IngestionJob] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ingest')
+        self._io_executor = ThreadPoolExecutor(max_workers=loader_threads, thread_name_prefix='loader')
+
+    @property
+    def chunk_store(self) -> ChunkStore:
+        return self._chunk_store or get_chunk_store()
+
+    @property
+    def job_store(self) -> JobStore:
+        return self._job_store or get_job_store()
+
+    def submit(self, session_id: str, sources: list[dict], upload_time: float, job_id: str = None) -> IngestionJob:
+        """Queue sources for ingestion and return the job tracking them"""
+        job = IngestionJob(session_id, sources, upload_time, job_id)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._save(job)
+        self._executor.submit(self._run, job)
+        logger.info(f"Queued ingestion job {job.id} with {len(sources)} source(s).")
+        return job
+
+    def get(self, job_id: str) -> IngestionJob | None:
+        """A job run by this process, or one another worker process saved"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        try:
+            row = self.job_store.get(job_id)
+        except StoreError as e:
+            logger.error(f"Could not read ingestion job {job_id}: {e}")
+            return None
+        return IngestionJob.from_row(row) if row else None
+
+    def _save(self, job: IngestionJob):
+        try:
+            self.job_store.save(job.to_row())
+        except StoreError as e:
+            logger.error(f"Could not save ingestion job {job.id}: {e}")
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+        try:
+            self.job_store.prune(cutoff)
+        except StoreError as e:
+            logger.warning(f"Could not prune ingestion jobs: {e}")
+
+    def _stored_chunks(self, source: dict, upload_time: float) -> tuple[Iterator[dict], float] | None:
+        """
+        Chunks of a source some session already uploaded, given the name and upload
+        time of this upload, and when they were loaded. Links are loaded again once
+        their copy is older than link_ttl, since the page may have changed.
+        """
+        metadata = File.source_metadata(source, upload_time)
+        try:
+            stored = self.chunk_store.find_document(metadata['doc_id']) if source.get('hash') else None
+        except StoreError as e:
+            logger.warning(f"Could not look up stored chunks of {source.get('name')}: {e}")
+            return None
+        if stored is None:
+            return None
+        session_id, loaded_at = stored
+        if source['file_type'] == 'link' and time.time() - loaded_at > self.link_ttl:
+            logger.info(f"Stored chunks of {source.get('name')} expired, loading it again")
+            return None
+
+        logger.info(f"Reusing stored chunks for {source.get('name')}")
+        chunks = self.chunk_store.iter_document(session_id, metadata['doc_id'])
+        return ({'text': chunk['text'], 'metadata': {**chunk['metadata'], **metadata}} for chunk in chunks), loaded_at
+
+    def _load_source(self, index: int, source: dict, job: IngestionJob, batches: queue.Queue):
+        """
+        Split a source on a loader thread, or read it back from the chunk store, putting
+        its chunks on batches in groups of batch_size as they are produced, then
+        ('done', (metadata, loaded_at)) or ('failed', error).
+        """
+        try:
+            stored = self._stored_chunks(source, job.upload_time)
+            chunks, loaded_at = stored if stored is not None else (File.iter_chunks(source, job.upload_time), time.time())
+            batch, count = [], 0
+            for chunk in chunks:
+                # Sources finish in any order, the chunk store puts them back in upload order
+                chunk['metadata']['source_index'] = index
+                batch.append(chunk)
+                if len(batch) == self.batch_size:
+                    batches.put((index, 'chunks', batch))
+                    count += len(batch)
+                    batch = []
+            if batch:
+                batches.put((index, 'chunks', batch))
+                count += len(batch)
+            if not count:
+                raise ValueError("The source appears to be empty or contains no readable content")
+            logger.info(f"Split {source.get('name')} into {count} chunks.")
+            batches.put((index, 'done', (File.source_metadata(source, job.upload_time), loaded_at)))
+        except Exception as e:
+            batches.put((index, 'failed', e))
+
+    def _store_batch(self, job: IngestionJob, chunks: list[dict]):
+        """Index one batch of chunks in the vector and chunk stores"""
+        self.vector_store.add_documents(chunks, job.session_id)
+        self.chunk_store.add(job.session_id, chunks)
+
+        if self.precompute_rerank:
+            try:
+                _chain_registry.get('re_ranker', ReRanker).precompute([chunk['text'] for chunk in chunks])
+            except Exception as e:
+                logger.warning(f"Re-ranker embeddings couldn't be precomputed: {e}")
+
+    def _remember_source(self, job: IngestionJob, chunk_count: int, metadata: dict, loaded_at: float):
+        """Point later uploads of a fully stored source at this session's copy"""
+        try:
+            self.chunk_store.add_document(job.session_id, metadata['doc_id'], chunk_count, loaded_at)
+        except StoreError as e:
+            logger.warning(f"Could not record stored chunks of {metadata['name']}: {e}")
+
+    def _discard_source(self, job: IngestionJob, source: dict):
+        """Remove the chunks already stored for a source that failed part way"""
+        doc_id = File.source_metadata(source, job.upload_time)['doc_id']
+        try:
+            self.vector_store.delete_document(job.session_id, doc_id)
+            self.chunk_store.delete_document(job.session_id, doc_id)
+        except Exception as e:
+            logger.error(f"Could not remove the partial chunks of {doc_id}: {e}")
+
+    def _run(self, job: IngestionJob):
+        """
+        Load every source concurrently on the loader threads and index their chunks
+        batch by batch as they arrive. The bounded queue between them keeps at most
+        a few batches in memory, whatever the size of the documents.
+        """
+        set_request_id(job.request_id)
+        job.status = 'running'
+        self._save(job)
+        stored = [0] * len(job.sources)
+        try:
+            batches = queue.Queue(maxsize=self.max_pending_batches)
+            for index, source in enumerate(job.sources):
+                # Loader threads attribute their spans to the upload request
+                self._io_executor.submit(contextvars.copy_context().run, self._load_source, index, source, job, batches)
+
+            logger.info(f"Adding documents from job {job.id} to vectorstore")
+            results, error = {}, None
+            while len(results) < len(job.sources):
+                index, kind, payload = batches.get()
+                if kind == 'chunks':
+                    if error is None:
+                        try:
+                            self._store_batch(job, payload)
+                            stored[index] += len(payload)
+                            job.chunk_count += len(payload)
+                        except Exception as e:
+                            # Keep draining the queue so the loader threads don't block
+                            error = e
+                    continue
+
+                results[index] = (kind, payload)
+                with self._lock:
+                    job.processed += 1
+                if kind == 'done' and error is None:
+                    self._remember_source(job, stored[index], *payload)
+                elif kind == 'failed' and stored[index]:
+                    self._discard_source(job, job.sources[index])
+                    job.chunk_count -= stored[index]
+                    stored[index] = 0
+                self._save(job)
+
+            if error is not None:
+                raise error
+
+            for index, source in enumerate(job.sources):
+                file_id = f"file_type_{source['group_id']}"
+                kind, payload = results[index]
+                if kind == 'done':
+                    job.files.append(payload[0])
+                    job.uploaded.append(file_id)
+                else:
+                    logger.error(f"Could not process file for group {source['group_id']}: {payload}")
+                    job.failed.append(file_id)
+                    job.errors.append(f"{source.get('name') or file_id}: {payload}")
+
+            if not job.chunk_count:
+                raise ValueError("No content to process")
+
+            job.status = 'completed'
+            logger.info(f"Ingestion job {job.id} completed with {job.chunk_count} chunks.")
+
+        except Exception as e:
+            logger.error(f"Ingestion job {job.id} failed: {e}")
+            job.errors.append(str(e))
+            job.status = 'failed'
+            # A failed job reports none of its sources as uploaded, so drop them all
+            for index, source in enumerate(job.sources):
+                if stored[index]:
+                    self._discard_source(job, source)
+            job.chunk_count = 0
+        finally:
+            for source in job.sources:
+                File.discard(source)
+            job.finished_at = time.time()
+            self._save(job)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+        self._io_executor.shutdown(wait=wait)
@@ -0,0 +1,124 @@
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from collections import defaultdict
+from typing import Iterable
+import threading
+import logging
+import heapq
+import math
+import re
+from .cache import content_hash
+
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r'\w+(?:[.\-]\w+)*')
+_PART = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+')
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercased terms keeping identifiers and version numbers whole
+    (store.get_retriever, v1.2.3) and adding their dotted, snake and camel case parts.
+    """
+    tokens = []
+    for match in _TOKEN.findall(text):
+        tokens.append(match.lower())
+        pieces = re.split(r'[.\-]', match)
+        if len(pieces) > 1:
+            tokens.extend(piece.lower() for piece in pieces if piece)
+        parts = _PART.findall(match)
+        if len(parts) > 1:
+            tokens.extend(part.lower() for part in parts)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 inverted index over chunks, updated incrementally as chunks are added"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: dict[str, dict[int, int]] = defaultdict(dict)
+        self._lengths: list[int] = []
+        self._documents: list[Document] = []
+        self._ids: dict[str, int] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def add(self, ids: Iterable[str], texts: Iterable[str], metadatas: Iterable[dict]) -> int:
+        """Index chunks not seen before, returning how many were added"""
+        added = 0
+        with self._lock:
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                if chunk_id in self._ids:
+                    continue
+                position = len(self._documents)
+                terms = tokenize(text)
+                counts = defaultdict(int)
+                for term in terms:
+                    counts[term] += 1
+                for term, count in counts.items():
+                    self._postings[term][position] = count
+                self._ids[chunk_id] = position
+                self._documents.append(Document(page_content=text, metadata=metadata or {}))
+                self._lengths.append(len(terms))
+                self._total_length += len(terms)
+                added += 1
+        return added
+
+    def search(self, query: str, k: int = 10) -> list[tuple[Document, float]]:
+        """The k best scoring chunks for query, best first"""
+        with self._lock:
+            size = len(self._documents)
+            if not size:
+                return []
+            average = self._total_length / size
+            scores = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (size - len(postings) + 0.5) / (len(postings) + 0.5))
+                for position, count in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[position] / average)
+                    scores[position] += idf * count * (self.k1 + 1) / (count + norm)
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [(self._documents[position], score) for position, score in best]
+
+    def ids(self) -> set[str]:
+        """Ids of every indexed chunk"""
+        with self._lock:
+            return set(self._ids)
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+
+def reciprocal_rank_fusion(rankings: list[list[Document]], k: int = 60, limit: int = None) -> list[Document]:
+    """Merge ranked lists by summing 1 / (k + rank), identifying chunks by their content"""
+    scores = defaultdict(float)
+    documents = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking, 1):
+            key = content_hash(document.page_content)
+            scores[key] += 1 / (k + rank)
+            documents.setdefault(key, document)
+    fused = sorted(scores, key=scores.get, reverse=True)
+    return [documents[key] for key in fused[:limit]]
+
+
+class HybridRetriever(BaseRetriever):
+    """Dense retriever results fused with BM25 results by reciprocal-rank fusion"""
+    dense: BaseRetriever
+    index: BM25Index
+    k: int = 10
+    lexical_k: int = 10
+    rrf_k: int = 60
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        dense = self.dense.invoke(query, config={'callbacks': run_manager.get_child()})
+        lexical = [document for document, _ in self.index.search(query, self.lexical_k)]
+        logger.debug(f"Fusing {len(dense)} dense and {len(lexical)} lexical results.")
+        return reciprocal_rank_fusion([dense, lexical], k=self.rrf_k, limit=self.k)
@@ -0,0 +1,261 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import deque
+from typing import Iterable, Iterator
+import threading
+import logging
+import secrets
+import bisect
+import time
+import re
+
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsError(Exception):
+    """Raised when a metric is redefined or used with the wrong labels"""
+    pass
+
+
+_request_id: ContextVar[str] = ContextVar('request_id', default='-')
+
+
+def new_request_id(incoming: str = None) -> str:
+    """Reuse a well-formed X-Request-ID from a proxy or client, otherwise make one"""
+    if incoming and re.fullmatch(r'[\w.\-]{1,64}', incoming):
+        return incoming
+    return secrets.token_hex(8)
+
+
+def get_request_id() -> str:
+    return _request_id.get()
+
+
+def set_request_id(request_id: str):
+    """Attribute spans and log records of the current thread or task to request_id"""
+    _request_id.set(request_id)
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds the current request id to log records as %(request_id)s"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        return True
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Monotonic counter per label combination"""
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labels):
+            raise MetricsError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in values]
+
+
+class Histogram:
+    """Cumulative histogram per label combination, with the sum and count of observations"""
+    type = 'histogram'
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (), buckets: Iterable[float] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets or self.DEFAULT_BUCKETS))
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    _key = Counter._key
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = [counts, total + value]
+
+    def count(self, **labels) -> int:
+        counts, _ = self._values.get(self._key(labels)) or ([0], 0.0)
+        return sum(counts)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                bucket = 'le="' + le + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, bucket)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Process-wide metrics rendered in the Prometheus text format.
+    Every server process has its own registry, so scrape each process
+    when running several.
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, documentation: str, labels: Iterable[str], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labels, **kwargs)
+            elif not isinstance(metric, cls) or metric.labels != tuple(labels):
+                raise MetricsError(f"Metric {name} is already registered as a {metric.type} with labels {metric.labels}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labels)
+
+    def histogram(self, name: str, documentation: str, labels: Iterable[str] = (), buckets: Iterable[float] = None) -> Histogram:
+        return self._register(Histogram, name, documentation, labels, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+_metrics = MetricsRegistry()
+
+STAGE_SECONDS = _metrics.histogram('papermind_stage_seconds', 'Duration of pipeline stages.', ['stage'])
+STAGE_ERRORS = _metrics.counter('papermind_stage_errors_total', 'Pipeline stages that raised.', ['stage'])
+REQUEST_SECONDS = _metrics.histogram('papermind_http_request_seconds', 'Duration of HTTP requests, including streamed bodies and saving the session.',
+                                     ['method', 'route', 'status'])
+
+
+class Span:
+    """One timed pipeline stage of a request"""
+
+    def __init__(self, stage: str, request_id: str, attributes: dict):
+        self.stage = stage
+        self.request_id = request_id
+        self.attributes = attributes
+        self.started_at = time.time()
+        self.seconds = None
+        self.error = None
+
+    def to_dict(self) -> dict:
+        return {'stage': self.stage, 'started_at': self.started_at, 'seconds': self.seconds,
+                'error': self.error, 'attributes': self.attributes}
+
+
+class SpanRecorder:
+    """The most recent spans, so the stages of one request can be looked up by its id"""
+
+    def __init__(self, max_spans: int = 10000):
+        self._spans: deque[Span] = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def record(self, span: Span):
+        STAGE_SECONDS.observe(span.seconds, stage=span.stage)
+        if span.error:
+            STAGE_ERRORS.inc(stage=span.stage)
+        with self._lock:
+            self._spans.append(span)
+        logger.debug(f"{span.stage} took {span.seconds} seconds {span.attributes or ''}")
+
+    def spans(self, request_id: str) -> list[dict]:
+        with self._lock:
+            return [span.to_dict() for span in self._spans if span.request_id == request_id]
+
+
+_span_recorder = SpanRecorder()
+
+
+@contextmanager
+def span(stage: str, **attributes) -> Iterator[Span]:
+    """Time the enclosed block as a stage of the current request"""
+    current = Span(stage, _request_id.get(), attributes)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.seconds = time.perf_counter() - start
+        _span_recorder.record(current)
+
+
+def observe(stage: str, seconds: float, **attributes):
+    """Record a stage timed elsewhere, e.g. in a worker process"""
+    current = Span(stage, _request_id.get(), attributes)
+    current.started_at -= seconds
+    current.seconds = seconds
+    _span_recorder.record(current)
+
+
+def timed(items: Iterable, stage: str, **attributes) -> Iterator:
+    """
+    Yield from items, recording the time spent producing them as one span once
+    they are exhausted. Time the consumer spends between items is not counted.
+    """
+    iterator = iter(items)
+    seconds = 0.0
+    current = Span(stage, _request_id.get(), attributes)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                seconds += time.perf_counter() - start
+                break
+            seconds += time.perf_counter() - start
+            yield item
+    except Exception as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.seconds = seconds
+        _span_recorder.record(current)
@@ -0,0 +1,119 @@
+from sentence_transformers import SentenceTransformer
+from typing import Any, Callable, Hashable
+import threading
+import logging
+import time
+import torch
+
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistryError(Exception):
+    """Raised when a model can not be loaded into the registry"""
+    pass
+
+
+def default_device() -> str:
+    """Pick the device local models should run on"""
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+class ModelRegistry:
+    """
+    Process-wide, thread-safe registry of local models.
+    Each model is loaded once (lazily on first use or eagerly via warm_up) and
+    shared by every request. When the app is served by a pre-forking server
+    with preloading enabled, models warmed at import time are shared by all workers.
+    """
+
+    def __init__(self):
+        self._models: dict[Hashable, Any] = {}
+        self._load_times: dict[Hashable, float] = {}
+        self._key_locks: dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _key_lock(self, key: Hashable) -> threading.Lock:
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = threading.Lock()
+            return self._key_locks[key]
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Return the model registered under key, loading it with loader on first use"""
+        model = self._models.get(key)
+        if model is not None:
+            return model
+
+        with self._key_lock(key):
+            model = self._models.get(key)
+            if model is not None:
+                return model
+
+            try:
+                start = time.perf_counter()
+                model = loader()
+                end = time.perf_counter()
+            except Exception as e:
+                logger.critical(f"Couldn't load model {key}: {e}")
+                raise ModelRegistryError(f"Couldn't load model {key}: {e}")
+
+            self._models[key] = model
+            self._load_times[key] = end - start
+            logger.info(f"Loaded model {key} in {end-start} seconds.")
+            return model
+
+    def get_sentence_transformer(self, model_path: str, truncate_dim: int = None, device: str = None) -> SentenceTransformer:
+        """Return a shared SentenceTransformer for the given path, dimensions and device"""
+        device = device or default_device()
+        key = ('sentence_transformer', model_path, truncate_dim, device)
+        return self.get(key, lambda: SentenceTransformer(model_path, truncate_dim=truncate_dim, device=device))
+
+    def warm_up(self, model_path: str, truncate_dim: int = None, device: str = None) -> None:
+        """Load a SentenceTransformer ahead of the first request and run a dummy encode"""
+        model = self.get_sentence_transformer(model_path, truncate_dim=truncate_dim, device=device)
+        try:
+            model.encode(["warm up"])
+            logger.info(f"Warmed up model {model_path}.")
+        except Exception as e:
+            logger.warning(f"Warm up encode failed for {model_path}: {e}")
+
+    def unload(self, key: Hashable) -> None:
+        """Drop a model from the registry"""
+        with self._key_lock(key):
+            self._models.pop(key, None)
+            self._load_times.pop(key, None)
+        logger.info(f"Unloaded model {key}.")
+
+    @staticmethod
+    def _model_bytes(model: Any) -> int:
+        try:
+            params = sum(p.numel() * p.element_size() for p in model.parameters())
+            buffers = sum(b.numel() * b.element_size() for b in model.buffers())
+            return params + buffers
+        except Exception:
+            return 0
+
+    def memory_usage(self) -> dict:
+        """Report approximate parameter memory and load time of every registered model"""
+        models = dict(self._models)
+        usage = {
+            str(key): {
+                'bytes': self._model_bytes(model),
+                'load_seconds': self._load_times.get(key, 0.0)
+            }
+            for key, model in models.items()
+        }
+        return {
+            'models': usage,
+            'total_bytes': sum(entry['bytes'] for entry in usage.values())
+        }
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._models
+
+    def __len__(self) -> int:
+        return len(self._models)
+
+
+_model_registry = ModelRegistry()
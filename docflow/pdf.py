@@ -0,0 +1,170 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator
+import multiprocessing
+import threading
+import logging
+import time
+import pymupdf
+from .metrics import observe
+
+
+logger = logging.getLogger(__name__)
+
+
+class PDFExtractionError(Exception):
+    """Raised when text can not be extracted from a PDF"""
+    pass
+
+
+_ocr_engine = None
+
+
+def _get_ocr():
+    """RapidOCR engine, created once per process on first use"""
+    global _ocr_engine
+    if _ocr_engine is None:
+        from rapidocr_onnxruntime import RapidOCR
+        _ocr_engine = RapidOCR()
+    return _ocr_engine
+
+
+def _ocr_image(image: bytes) -> str:
+    result, _ = _get_ocr()(image)
+    if not result:
+        return ''
+    return '\n'.join(line[1] for line in result)
+
+
+def _extract_page(document: pymupdf.Document, page: pymupdf.Page, min_text_chars: int, min_image_area: float) -> dict:
+    start = time.perf_counter()
+    text = page.get_text().strip()
+    ocr_parts = []
+    ocr_start = time.perf_counter()
+
+    try:
+        if len(text) < min_text_chars:
+            pixmap = page.get_pixmap(dpi=150)
+            ocr_parts.append(_ocr_image(pixmap.tobytes('png')))
+        else:
+            page_area = abs(page.rect) or 1.0
+            for image in page.get_image_info(xrefs=True):
+                if not image.get('xref') or abs(pymupdf.Rect(image['bbox'])) / page_area < min_image_area:
+                    continue
+                ocr_parts.append(_ocr_image(document.extract_image(image['xref'])['image']))
+    except Exception as e:
+        logger.warning(f"OCR failed on page {page.number}, keeping its text layer only: {e}")
+
+    ocr_text = '\n'.join(part for part in ocr_parts if part.strip())
+    return {
+        'page': page.number,
+        'text': '\n'.join(part for part in (text, ocr_text) if part),
+        'ocr': bool(ocr_parts),
+        'ocr_seconds': time.perf_counter() - ocr_start if ocr_parts else 0.0,
+        'seconds': time.perf_counter() - start
+    }
+
+
+def extract_pages(path: str, page_numbers: list[int], min_text_chars: int = 20, min_image_area: float = 0.25) -> list[dict]:
+    """
+    Extract the text of the given pages, running OCR only on pages without a text
+    layer (the rendered page) or on images covering at least min_image_area of the page.
+    """
+    with pymupdf.open(path) as document:
+        return [_extract_page(document, document[number], min_text_chars, min_image_area) for number in page_numbers]
+
+
+class PDFExtractor:
+    """
+    Extracts every page of a PDF, fanning batches of pages out to a process pool.
+    Small documents are extracted in the calling process.
+    """
+
+    def __init__(self, max_workers: int = None, pages_per_task: int = 8,
+                 min_text_chars: int = 20, min_image_area: float = 0.25):
+        self.max_workers = max_workers
+        self.pages_per_task = pages_per_task
+        self.min_text_chars = min_text_chars
+        self.min_image_area = min_image_area
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _reset_executor(self, broken: ProcessPoolExecutor):
+        """Drop a pool whose worker died, unless another thread already replaced it"""
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _pool_results(self, path: str, batches: list[list[int]], retries: int = 1) -> Iterator[list[dict]]:
+        """
+        Extract batches on the process pool, yielding their pages in order. A worker
+        crash breaks the whole pool, so it is replaced and the batches not yet yielded
+        are submitted again, at most retries times before the source fails.
+        """
+        done = 0
+        while True:
+            executor = self._get_executor()
+            try:
+                futures = [executor.submit(extract_pages, path, batch, self.min_text_chars, self.min_image_area)
+                           for batch in batches[done:]]
+                for future in futures:
+                    yield future.result()
+                    done += 1
+                return
+            except BrokenProcessPool:
+                self._reset_executor(executor)
+                if not retries:
+                    raise
+                retries -= 1
+                logger.warning(f"PDF worker pool broke while extracting {path}, retrying {len(batches) - done} batches")
+
+    def lazy_extract(self, path: str) -> Iterator[dict]:
+        """Yield page dicts (page, text, ocr, ocr_seconds, seconds) in page order as they are extracted"""
+        try:
+            with pymupdf.open(path) as document:
+                page_count = document.page_count
+        except Exception as e:
+            raise PDFExtractionError(f"Couldn't open PDF {path}: {e}")
+
+        batches = [list(range(i, min(i + self.pages_per_task, page_count)))
+                   for i in range(0, page_count, self.pages_per_task)]
+        start = time.perf_counter()
+        ocr_pages = 0
+
+        try:
+            if len(batches) <= 1 or self.max_workers == 0:
+                results = (extract_pages(path, batch, self.min_text_chars, self.min_image_area) for batch in batches)
+            else:
+                results = self._pool_results(path, batches)
+
+            for pages in results:
+                for page in pages:
+                    ocr_pages += page['ocr']
+                    if page['ocr']:
+                        # Pages may be extracted in worker processes, so OCR time is recorded here
+                        observe('ocr', page['ocr_seconds'], page=page['page'])
+                    logger.debug(f"Extracted page {page['page']} of {path} in {page['seconds']} seconds (ocr={page['ocr']}).")
+                    yield page
+
+        except Exception as e:
+            logger.error(f"Failed to extract text from {path}: {e}")
+            raise PDFExtractionError(f"Failed to extract text from {path}: {e}")
+
+        end = time.perf_counter()
+        logger.info(f"Extracted {page_count} pages ({ocr_pages} with OCR) from {path} in {end-start} seconds.")
+
+    def extract(self, path: str) -> list[dict]:
+        """Extract every page of the PDF"""
+        return list(self.lazy_extract(path))
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
@@ -61,4 +61,27 @@ class Prompts:
         template='''From the given content figure what topic is being talked about in this and only output the Topic name, if it clearly seems like a sub-topic output 
         both topic and the corresponding sub-topic like Topic:sub-topic(s).\n{content}''',
         input_variables=['content']
-    )
\ No newline at end of file
+    )
+
+    MapPrompt = PromptTemplate(
+        template='''You are preparing material for {task}. Extract from the following excerpt of the source "{name}" every key point, definition, formula, date, event and
+        structural element (classes, functions, sections) that would be needed for it. Be concise, keep the original terminology and don't add information that isn't
+        in the excerpt.\n{text}''',
+        input_variables=['task', 'name', 'text']
+    )
+
+    CombinePrompt = PromptTemplate(
+        template='''You are preparing material for {task}. Merge the following notes into one set of notes, removing repetition but keeping every distinct key point,
+        definition, formula, date and structural element. Keep the "Source:" headings so each point stays attributed to its source.\n{text}''',
+        input_variables=['task', 'text']
+    )
+
+    ChatSummaryPrompt = PromptTemplate(
+        template='''Update the running summary of a conversation between a user and PaperMind, an assistant answering questions about the user's documents, with
+        the new messages below. Keep the questions asked, the answers given, names, numbers and any preferences the user stated. Drop greetings and repetition.
+        Output only the updated summary.
+        summary:{summary}
+
+        new messages:{messages}''',
+        input_variables=['summary', 'messages']
+    )
@@ -1,20 +1,29 @@
 from langchain_chroma import Chroma
-from langchain_google_genai.embeddings import GoogleGenerativeAIEmbeddings
-from langchain_google_genai.chat_models import ChatGoogleGenerativeAI
+from langchain_core.embeddings import Embeddings
 from langchain_core.runnables import RunnableParallel, RunnablePassthrough, RunnableSequence, RunnableLambda, Runnable
 from langchain_core.documents import Document
 from langchain_core.vectorstores import VectorStoreRetriever
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 import logging
-from typing import Union, Literal
+from typing import Iterator, Union, Literal
 from dotenv import load_dotenv
-from langchain_core.output_parsers import StrOutputParser
 from flask.sessions import SessionMixin
-from sentence_transformers import SentenceTransformer
-from sentence_transformers.util import cos_sim
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import contextvars
+import chromadb
 import time
-import torch
-from .prompts import Prompts
+import json
+import os
+from .chains import ChainRegistryError, _chain_registry
+from .models import ModelRegistry, _model_registry, default_device
+from .embeddings import EmbeddingProviderError, get_embeddings
+from .cache import CacheError, EmbeddingCache, LRUCache, SemanticCache, content_hash, get_answer_cache, get_embedding_cache
+from .store import ChunkStore, MessageStore, StoreError, get_chunk_store, get_message_store
+from .lexical import BM25Index, HybridRetriever
+from .retrieval import RetrievalConfig, get_retrieval_config
+from .metrics import observe, span, timed
 
 
 logger = logging.getLogger(__name__)
@@ -42,103 +51,292 @@ class ReRankerError(DocumentQAError):
     """Raised when re-ranker operations fail"""
     pass
 
+RERANKER_MODEL_PATH = r"Reranker\mxbai-embed-large-v1"
+
 class ReRanker(Runnable):
-    def __init__(self, dimensions: int = None, model_path: str = None):
-        self.cache = {}
+    def __init__(self, dimensions: int = None, model_path: str = None, registry: ModelRegistry = None,
+                 top_k: int = 5, batch_size: int = 32, cache: EmbeddingCache = None):
         self.dimensions = dimensions or 512
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model_path = model_path or r"Reranker\mxbai-embed-large-v1"
+        self.device = default_device()
+        self.model_path = model_path or RERANKER_MODEL_PATH
+        self.registry = registry or _model_registry
+        self.top_k = top_k
+        self.batch_size = batch_size
         try:
-            logger.debug(f'Initializing Sentence Transformer using {self.device}')
-            if not self.cache.get('transformer', None):
-                self.cache['transformer'] = SentenceTransformer(self.model_path, truncate_dim=self.dimensions, device=self.device)
+            logger.debug(f'Fetching Sentence Transformer on {self.device} from the model registry')
+            self.model = self.registry.get_sentence_transformer(self.model_path, truncate_dim=self.dimensions, device=self.device)
         except Exception as e:
             logger.critical(f"Couldn't get Sentence Transformer from {self.model_path}.")
             raise ReRankerError(f"Couldn't get Sentence Transformer from {self.model_path}: {e}")
+        self.cache = cache if cache is not None else get_embedding_cache(self.model_path, self.dimensions)
+        self._queries = LRUCache(256)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Normalised query embedding, remembered for recently seen queries"""
+        vector = self._queries.get(query)
+        if vector is None:
+            vector = self.model.encode(query, prompt_name="query", convert_to_numpy=True, normalize_embeddings=True)
+            self._queries.put(query, vector)
+        return vector
+
+    def embed_documents(self, texts: list[str]) -> np.ndarray:
+        """Embed chunks, encoding only those missing from the embedding cache"""
+        keys = [content_hash(text) for text in texts]
+        cached = self.cache.get_many(keys)
+        missing = {key: text for key, text in zip(keys, texts) if key not in cached}
+
+        if missing:
+            vectors = self.model.encode(list(missing.values()),
+                                        batch_size=self.batch_size,
+                                        convert_to_numpy=True,
+                                        normalize_embeddings=True)
+            computed = dict(zip(missing.keys(), vectors))
+            try:
+                self.cache.put_many(computed)
+            except CacheError as e:
+                logger.warning(f"Couldn't cache document embeddings: {e}")
+            cached.update(computed)
 
-    def invoke(self, inputs:dict, metadata:dict = None) -> list[Document]:
+        logger.debug(f'Embedding cache served {len(texts)-len(missing)} of {len(texts)} documents.')
+        return np.stack([cached[key] for key in keys])
+
+    def precompute(self, texts: list[str]) -> None:
+        """Populate the embedding cache ahead of the first query"""
         try:
-            query = [inputs["query"]]
-            documents = inputs['retrieved']
-            model = self.cache.get('transformer', None)
+            with span('rerank_precompute', chunks=len(texts)) as timer:
+                self.embed_documents(texts)
+            logger.info(f'Precomputed re-ranker embeddings for {len(texts)} chunks in {timer.seconds} seconds.')
+        except Exception as e:
+            raise ReRankerError(f"Couldn't precompute document embeddings: {e}")
 
-            try:
-                start = time.perf_counter()
-                query_embed = model.encode(query, prompt_name="query")
-                docs_embed = [model.encode(document.page_content) for document in documents]
-                end = time.perf_counter()
-                logger.debug(f'Computed embeddings from query and {len(docs_embed)} documnets in {end-start} seconds.')
-            except Exception as e:
-                logger.error("Couldn't encode query or document(s).")
-                raise ReRankerError(f"Couldn't encode query or document(s): {e}")
+    @staticmethod
+    def select_top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the k highest scores in descending order using a partial sort"""
+        if k >= len(scores):
+            return np.argsort(-scores)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
 
-            scores = cos_sim(query_embed, docs_embed).tolist()[0]
-            logger.info(f'Computed scores for {len(scores)} against the query.')
-            
-            scored_docs = sorted(
-                zip(scores, documents), key=lambda x: x[0], reverse=True
-            )
-            logger.info(f'Sorted scores for {len(scored_docs)} documnets.')
-            return [doc for score, doc in scored_docs[:5]]
+    def invoke(self, inputs:dict, metadata:dict = None) -> list[Document]:
+        try:
+            query = inputs["query"]
+            documents = inputs['retrieved']
+            if not documents:
+                return []
+
+            with span('rerank', candidates=len(documents)):
+                try:
+                    start = time.perf_counter()
+                    query_embed = self.embed_query(query)
+                    docs_embed = self.embed_documents([document.page_content for document in documents])
+                    end = time.perf_counter()
+                    logger.debug(f'Computed embeddings from query and {len(docs_embed)} documnets in {end-start} seconds.')
+                except Exception as e:
+                    logger.error("Couldn't encode query or document(s).")
+                    raise ReRankerError(f"Couldn't encode query or document(s): {e}")
+
+                scores = docs_embed @ query_embed
+                logger.info(f'Computed scores for {len(scores)} against the query.')
+
+                top = self.select_top_k(scores, inputs.get('top_k') or self.top_k)
+            logger.info(f'Selected top {len(top)} of {len(scores)} documnets.')
+            return [documents[i] for i in top]
         
         except Exception as e:
             raise ReRankerError(f'Could not Re-rank documents according to the query: {e}')
 
 class VectorStore:
-    def __init__(self, collection_name="user", persist_directory=None):
-        self._vectorstore = None
-        self._retriever = None
+    """
+    Shared vector store partitioned into one Chroma collection per session,
+    so searches only scan the chunks uploaded by that session. Collection
+    handles, retrievers and BM25 indexes are kept for the max_sessions most
+    recently used sessions.
+    """
+    def __init__(self, collection_name="user", persist_directory=None, embeddings: Embeddings = None,
+                 batch_size: int = 64, max_workers: int = 4, chunk_store: ChunkStore = None, max_sessions: int = 256):
+        self._client = None
+        self._embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self._stores = LRUCache(max_sessions)
+        self._retrievers = LRUCache(max_sessions * 4)
+        self._lexical = LRUCache(max_sessions)
+        self._lexical_locks = LRUCache(max_sessions)
+        self._chunk_store = chunk_store
+        self._lock = threading.Lock()
+        self._init_lock = threading.Lock()
         self.collection_name = collection_name
         self.persist_directory = persist_directory
 
-        self._init_vectorstore()
-        
+    @property
+    def chunk_store(self) -> ChunkStore:
+        return self._chunk_store or get_chunk_store()
+
     def _init_vectorstore(self):
         """
-        Create or load the shared persistent or in-memory vector store.
-        Call this ONCE at app startup.
+        Create or load the shared persistent or in-memory Chroma client on first use,
+        so importing this module in a worker process doesn't open the store.
         """
-
-        if self._vectorstore is None:
-            try:
-                embeddings = GoogleGenerativeAIEmbeddings(model='models/text-embedding-004')
-                logger.debug("Google Generative AI Embeddings initialized")
-            except Exception as e:
-                logger.critical(f"Failed to initialize embeddings: {e}")
-                raise VectorStoreError(f"Failed to initialize embeddings: {e}")
+        if self._client is not None:
+            return
+
+        with self._init_lock:
+            if self._client is not None:
+                return
+
+            if self._embeddings is None:
+                try:
+                    self._embeddings = get_embeddings()
+                except EmbeddingProviderError as e:
+                    raise VectorStoreError(f"Failed to initialize embeddings: {e}")
                 
             try:
-                self._vectorstore = Chroma(
-                    collection_name="user",
-                    embedding_function=embeddings,
-                    collection_metadata={"hnsw:space": "cosine"},
-                    persist_directory=self.persist_directory
-                )
-                logger.info(f"Vectorstore initialized in memory")
+                if self.persist_directory:
+                    self._client = chromadb.PersistentClient(path=self.persist_directory)
+                    logger.info(f"Vectorstore client initialized at {self.persist_directory}")
+                else:
+                    self._client = chromadb.EphemeralClient()
+                    logger.info("Vectorstore client initialized in memory")
             except Exception as e:
                 logger.error(f"Failed to create vector store: {e}")
                 raise VectorStoreError(f"Failed to create vector store: {e}")
-                
+
+    def collection_for(self, session_id: str) -> str:
+        """Name of the collection holding a session's chunks"""
+        if not session_id:
+            raise ValueError("A session id is required to access the vector store.")
+        return f"{self.collection_name}_{session_id}"
+
+    def corpus_version(self, session_id: str) -> int:
+        """
+        Number that changes whenever the session's chunks change, 0 before the first upload.
+        It is read from the chunk store, which ingestion writes after the vectors, so every
+        worker process sees a new version once an upload's chunks are searchable.
+        """
+        return self.chunk_store.version(session_id)
+
+    def get_lexical_index(self, session_id: str, version: int = None) -> BM25Index:
+        """
+        BM25 index of the session's chunks at a corpus version, the current one by default.
+        It is built from the collection on first use. Once the version changes only the
+        chunks it is missing are added, so chunks uploaded through another worker process
+        are found too; it is rebuilt only when chunks were deleted from the collection.
+        """
+        name = self.collection_for(session_id)
+        version = self.corpus_version(session_id) if version is None else version
+        cached = self._lexical.get(name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        collection = self._get_store(session_id)._collection
+        with self._lexical_lock(name):
+            cached = self._lexical.get(name)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+
+            with span('lexical_index') as timer:
+                index, new = cached[1] if cached is not None else None, None
+                if index is not None:
+                    current, known = set(collection.get(include=[])['ids']), index.ids()
+                    # BM25Index can't drop chunks, so deleted chunks mean a rebuild
+                    new = list(current - known) if known <= current else None
+                if new is None:
+                    index, stored = BM25Index(), collection.get(include=['documents', 'metadatas'])
+                elif new:
+                    stored = collection.get(ids=new, include=['documents', 'metadatas'])
+                else:
+                    stored = {'ids': [], 'documents': [], 'metadatas': []}
+                added = index.add(stored['ids'], stored['documents'], stored['metadatas'])
+                self._lexical.put(name, (version, index))
+            logger.info(f"Added {added} chunks to the BM25 index of {name} ({len(index)} in total) "
+                        f"at version {version} in {timer.seconds} seconds.")
+            return index
+
+    def _lexical_lock(self, name: str) -> threading.Lock:
+        """Lock serialising BM25 index builds of one collection"""
+        with self._lock:
+            lock = self._lexical_locks.get(name)
+            if lock is None:
+                lock = threading.Lock()
+                self._lexical_locks.put(name, lock)
+            return lock
+
+    def _get_store(self, session_id: str) -> Chroma:
+        name = self.collection_for(session_id)
+        self._init_vectorstore()
+        with self._lock:
+            store = self._stores.get(name)
+            if store is None:
+                store = Chroma(
+                    client=self._client,
+                    collection_name=name,
+                    embedding_function=self._embeddings,
+                    collection_metadata={"hnsw:space": "cosine"}
+                )
+                self._stores.put(name, store)
+                logger.debug(f"Opened collection {name}")
+            return store
         
-    def add_documents(self, documents: list[dict])->None:
+    def _embed_batches(self, texts: list[str]) -> list[list[float]]:
+        """Embed texts in batches, running up to max_workers batches concurrently"""
+        batches = [texts[i:i+self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1 or self.max_workers <= 1:
+            vectors = [self._embeddings.embed_documents(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+                vectors = list(executor.map(self._embeddings.embed_documents, batches))
+        return [vector for batch in vectors for vector in batch]
+
+    def _get_chunk_collection(self):
+        """Content-addressed collection holding one embedding per distinct chunk across all sessions"""
+        return self._client.get_or_create_collection(f"{self.collection_name}_chunks", metadata={"hnsw:space": "cosine"})
+
+    def add_documents(self, documents: list[dict], session_id: str)->None:
         """
-        Add parsed docs to the shared vector store.
+        Add parsed docs to the session's collection.
+        Chunks are stored under their content hash: chunks the session already has
+        are skipped and chunks embedded for any other session are linked by reusing
+        their vectors, so only unseen content is embedded.
         Call this in /upload route.
         """
         try:
             if not documents:
                 raise ValueError("No documents provided to add.")
-            if self._vectorstore is None:
-                raise RuntimeError("Vectorstore not initialized. Call init_vectorstore() first.")
-            
-            texts = [doc['text'] for doc in documents]
-            metadatas = [doc['metadata'] for doc in documents]
+
+            unique = {}
+            for doc in documents:
+                unique.setdefault(content_hash(doc['text']), doc)
 
             try:
-                start = time.perf_counter()
-                self._vectorstore.add_texts(texts, metadatas=metadatas)
-                end = time.perf_counter()
-                logger.debug(f"Successfully added {len(documents)} documents to vector store in {end-start} seconds")
+                collection = self._get_store(session_id)._collection
+                existing = set(collection.get(ids=list(unique), include=[])['ids'])
+                new = {chunk_id: doc for chunk_id, doc in unique.items() if chunk_id not in existing}
+                if not new:
+                    logger.info(f"All {len(documents)} documents are already in the session's collection")
+                    return
+
+                chunk_collection = self._get_chunk_collection()
+                stored = chunk_collection.get(ids=list(new), include=['embeddings'])
+                vectors = dict(zip(stored['ids'], stored['embeddings'] if stored['embeddings'] is not None else []))
+                missing = [chunk_id for chunk_id in new if chunk_id not in vectors]
+
+                if missing:
+                    with span('embed', chunks=len(missing)) as timer:
+                        embeddings = self._embed_batches([new[chunk_id]['text'] for chunk_id in missing])
+                    logger.debug(f"Embedded {len(missing)} documents in {timer.seconds} seconds")
+                    chunk_collection.upsert(ids=missing, embeddings=embeddings)
+                    vectors.update(zip(missing, embeddings))
+
+                ids = list(new)
+                with span('vector_insert', chunks=len(ids)) as timer:
+                    collection.add(
+                        ids=ids,
+                        embeddings=[vectors[chunk_id] for chunk_id in ids],
+                        documents=[new[chunk_id]['text'] for chunk_id in ids],
+                        metadatas=[new[chunk_id]['metadata'] for chunk_id in ids]
+                    )
+                logger.debug(f"Successfully added {len(ids)} documents to vector store in {timer.seconds} seconds "
+                             f"({len(documents)-len(ids)} already present, {len(ids)-len(missing)} linked, {len(missing)} embedded)")
             except Exception as e:
                 logger.error(f"Failed to add documents to vector store: {e}")
                 raise VectorStoreError(f"Failed to add documents: {e}")
@@ -147,92 +345,217 @@ class VectorStore:
             raise VectorStoreError(f'Unable to insert documents: {e}')
         
 
-    def get_retriever(self, search_type:Literal["similarity", "mmr", "similarity_score_threshold"]="similarity")->VectorStoreRetriever:
+    def get_retriever(self, session_id: str, search_type:Literal["similarity", "mmr", "similarity_score_threshold", "hybrid"]="similarity",
+                      config: RetrievalConfig = None)->VectorStoreRetriever | HybridRetriever:
         """
-        Get a retriever from the current vectorstore.
+        Get a retriever over the session's collection, built from config when given.
+        hybrid fuses the dense search with BM25 search over the same chunks, so
+        hybrid retrievers are keyed by corpus version as well.
         """
         try:
-            if self._vectorstore is None:
-                raise RuntimeError("Vectorstore not initialized.")
-            if self._retriever is None:
-                self._retriever = self._vectorstore.as_retriever(search_type=search_type, search_kwargs={'k':10})
-                logger.info("Retriever created from vectorstore.")
-            return self._retriever
+            config = config or RetrievalConfig(search_type=search_type)
+            version = self.corpus_version(session_id) if config.search_type == 'hybrid' else None
+            key = (self.collection_for(session_id), config, version)
+            retriever = self._retrievers.get(key)
+            if retriever is None:
+                if config.search_type == 'hybrid':
+                    retriever = HybridRetriever(dense=self.get_retriever(session_id, config=config.dense),
+                                                index=self.get_lexical_index(session_id, version),
+                                                k=config.k, lexical_k=config.lexical_k)
+                    # Hybrid retrievers of older versions would keep their stale indexes alive
+                    for stale in [stale for stale in self._retrievers.keys()
+                                  if stale[0] == key[0] and stale[2] not in (None, version)]:
+                        self._retrievers.pop(stale)
+                else:
+                    retriever = self._get_store(session_id).as_retriever(search_type=config.search_type,
+                                                                         search_kwargs=config.search_kwargs())
+                self._retrievers.put(key, retriever)
+                logger.info(f"{config.search_type} retriever created for collection {key[0]}.")
+            return retriever
         
         except Exception as e:
             raise VectorStoreError(f'Unable to create Retriever from Vector Store: {e}')
+
+    def delete_document(self, session_id: str, doc_id: str) -> None:
+        """Drop the vectors of one source of a session"""
+        try:
+            name = self.collection_for(session_id)
+            self._get_store(session_id)._collection.delete(where={'doc_id': doc_id})
+            logger.info(f"Deleted {doc_id} from collection {name}")
+        except Exception as e:
+            raise VectorStoreError(f'Unable to delete vectors for document: {e}')
+
+    def delete_session(self, session_id: str) -> None:
+        """
+        Drop every vector stored for a session.
+        Call this in /reset-session route.
+        """
+        try:
+            name = self.collection_for(session_id)
+            self._init_vectorstore()
+            with self._lock:
+                self._stores.pop(name, None)
+                self._lexical.pop(name, None)
+                for key in [key for key in self._retrievers.keys() if key[0] == name]:
+                    self._retrievers.pop(key)
+                if name in [c if isinstance(c, str) else c.name for c in self._client.list_collections()]:
+                    self._client.delete_collection(name)
+            logger.info(f"Deleted collection {name}")
+        except Exception as e:
+            raise VectorStoreError(f'Unable to delete vectors for session: {e}')
             
         
-_vector_store = VectorStore(persist_directory=r'MindVectorStore')
+_vector_store = VectorStore(persist_directory=r'MindVectorStore',
+                            batch_size=int(os.getenv('PAPERMIND_EMBED_BATCH_SIZE', 64)),
+                            max_workers=int(os.getenv('PAPERMIND_EMBED_WORKERS', 4)),
+                            max_sessions=int(os.getenv('PAPERMIND_CACHED_SESSIONS', 256)))
+
+_answer_cache = get_answer_cache()
+_retrieval_cache = LRUCache(int(os.getenv('PAPERMIND_RETRIEVAL_CACHE_SIZE', 1024)))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of English text, about four characters per token"""
+    return len(text) // 4 + 1
+
+
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='summary')
 
 
 class ChatHistory:
-    """Manages chat history using Flask session"""
-    
-    def __init__(self, session: Union[SessionMixin, dict]):
+    """
+    Chat history of a session, kept in the message store instead of the session.
+    Chains see a rolling summary of older turns followed by the most recent
+    messages fitting in token_budget. Once the messages that fell out of the
+    window reach summary_tokens they are folded into the summary in the background.
+    """
+    TOKEN_BUDGET = int(os.getenv('PAPERMIND_HISTORY_TOKENS', 2000))
+    SUMMARY_TOKENS = int(os.getenv('PAPERMIND_SUMMARY_TOKENS', 1000))
+    _summarising: set[str] = set()
+    _summarising_lock = threading.Lock()
+
+    def __init__(self, session: Union[SessionMixin, dict], store: MessageStore = None,
+                 token_budget: int = None, summary_tokens: int = None):
         try:
             if not isinstance(session, SessionMixin) and not isinstance(session, dict):
                 raise TypeError("Expected a Flask SessionMixin object")
-            self.session = session
+            self.session_id = session.get('session_id')
         except Exception as e:
             raise SessionError(f'Failed to get session: {e}')
+        self.store = store or get_message_store()
+        self.token_budget = token_budget or self.TOKEN_BUDGET
+        self.summary_tokens = summary_tokens or self.SUMMARY_TOKENS
 
-    def add_message(self, message: str):
-        """Add a message to chat history"""
+    def add_message(self, message: str, role: Literal['user', 'assistant'] = None):
+        """Add a message to chat history, alternating user and assistant when no role is given"""
         if not message or not message.strip():
             raise ValueError('Message is empty.')
+        if not self.session_id:
+            raise SessionError("Session has no session id.")
         try:
-            history = self.session.get('chat_history', [])
-
-            next_index = len(history)
-
-            role = 'user' if next_index%2==0 else 'assistant'
-
-            history.append({'role': role, 'content': message})
-            logger.debug(f"Added {role} message to chat history. Total messages: {len(history)}")
-
-
-            self.session['chat_history'] = history
-
-        except Exception as e:
+            role = role or ('user' if self.store.count(self.session_id) % 2 == 0 else 'assistant')
+            self.store.append(self.session_id, role, message)
+            logger.debug(f"Added {role} message to chat history.")
+        except StoreError as e:
             logger.error(f"Failed to add message to chat history: {e}")
             raise SessionError(f"Failed to update chat history: {e}")
 
     def get_history(self) -> list:
         """Get the complete chat history"""
-        return self.session.get('chat_history', [])
-    
-    def format_history_for_chain(self) ->list[Union[HumanMessage, AIMessage]]:
-        history = self.get_history()
-        formatted_history = []
+        return [{'role': message['role'], 'content': message['content']} for message in self.store.messages(self.session_id)]
 
-        for message in history:
+    def last_answer(self) -> str | None:
+        """The newest assistant message"""
+        return self.store.last(self.session_id, 'assistant')
+
+    def window(self) -> tuple[str, list[dict], list[dict]]:
+        """
+        The summary, the unsummarised messages that fell out of the token window,
+        and the newest messages fitting in the window (always at least one).
+        """
+        summary, upto = self.store.get_summary(self.session_id)
+        messages = self.store.messages(self.session_id, after=upto)
+
+        used, start = 0, len(messages)
+        while start > 0:
+            tokens = estimate_tokens(messages[start - 1]['content'])
+            if start < len(messages) and used + tokens > self.token_budget:
+                break
+            used += tokens
+            start -= 1
+        return summary, messages[:start], messages[start:]
+
+    def format_history_for_chain(self) -> list[Union[SystemMessage, HumanMessage, AIMessage]]:
+        summary, overflow, recent = self.window()
+        formatted_history = [SystemMessage(content=f"Summary of the earlier conversation: {summary}")] if summary else []
+
+        for message in recent:
             role = message.get('role', '')
             content = message.get('content', '')
-            
-            if role == 'Human':
+
+            if role == 'user':
                 formatted_history.append(HumanMessage(content=content))
-            elif role == 'LLM':  
+            elif role == 'assistant':
                 formatted_history.append(AIMessage(content=content))
             else:
                 logger.warning(f"Unexpected role in chat history: {role}")
                 formatted_history.append(AIMessage(content=content))
-        
+
+        if sum(estimate_tokens(message['content']) for message in overflow) >= self.summary_tokens:
+            self.summarise_async(summary, overflow)
+
         return formatted_history
-    
+
+    def summarise(self, summary: str, messages: list[dict]) -> str:
+        """Fold messages into the running summary and store it"""
+        text = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+        with span('llm_summary', messages=len(messages)) as timer:
+            updated = _chain_registry.summary_chain.invoke({'summary': summary or 'None', 'messages': text})
+        self.store.set_summary(self.session_id, updated, messages[-1]['seq'])
+        logger.info(f"Summarised {len(messages)} chat messages in {timer.seconds} seconds.")
+        return updated
+
+    def summarise_async(self, summary: str, messages: list[dict]):
+        """Summarise in the background, at most once at a time per session"""
+        with self._summarising_lock:
+            if self.session_id in self._summarising:
+                return
+            self._summarising.add(self.session_id)
+
+        def run():
+            try:
+                self.summarise(summary, messages)
+            except Exception as e:
+                logger.warning(f"Chat history couldn't be summarised: {e}")
+            finally:
+                with self._summarising_lock:
+                    self._summarising.discard(self.session_id)
+
+        _summary_executor.submit(contextvars.copy_context().run, run)
+
     def clear_history(self):
         """Clear the chat history"""
-        self.session['chat_history'] = []
+        if self.session_id:
+            self.store.delete_session(self.session_id)
 
 
 class DocumentQA:
     """A complete document-based question-answering system with RAG capabilities"""
-    def __init__(self, session: SessionMixin, vector_store: VectorStore=None):        
+    def __init__(self, session: SessionMixin, vector_store: VectorStore=None, answer_cache: SemanticCache=None,
+                 retrieval_cache: LRUCache=None, config: RetrievalConfig=None):
         try:
+            self.config = config or get_retrieval_config()
             self.chat_history = ChatHistory(session)
+            self.answer_cache = answer_cache or _answer_cache
+            self.retrieval_cache = retrieval_cache if retrieval_cache is not None else _retrieval_cache
+            self.corpus = sorted(file['doc_id'] for file in session.get('upload_meta', {}).get('files', []))
+            self.session_id = session.get('session_id')
+            if not self.session_id:
+                raise SessionError("Session has no session id, upload documents first.")
             self.vector_store = vector_store or _vector_store
-            self.retriever = self.vector_store.get_retriever(search_type='mmr')
-            self.re_ranker = ReRanker()
+            self.retriever = self.vector_store.get_retriever(self.session_id, config=self.config)
+            needs_re_ranker = self.config.rerank or self.answer_cache is not None
+            self.re_ranker = _chain_registry.get('re_ranker', ReRanker) if needs_re_ranker else None
             self.qa_chain, self.retriever_chain = self.build_chain()
             
             logger.info("DocumentQA initialized successfully")
@@ -280,58 +603,117 @@ class DocumentQA:
                 'sources': []
             }
     
-    def build_chain(self) -> tuple[RunnableSequence, RunnableSequence]:
-        """Build the RAG chain"""
-        parser = StrOutputParser()
-
-        try: 
-            logger.info('Initializing Gemini for QnA.')
-            gemini = ChatGoogleGenerativeAI(
-                model="gemini-2.0-flash",
-                temperature=0.5
-            )
+    def search(self, user_query: str) -> list[Document]:
+        """Candidate chunks for a query from the session's retriever"""
+        with span('retrieve', search_type=self.config.search_type):
+            return self.retriever.invoke(user_query)
 
-        except Exception as e:
-            logger.critical("Gemini Couldn't be initialized for QnA.", exc_info=True, stack_info=True)
+    def build_chain(self) -> tuple[RunnableSequence, RunnableSequence]:
+        """Build the RAG chain from the process-wide QA chain and the session's retriever"""
+        try:
+            qa_chain = _chain_registry.qa_chain
+        except ChainRegistryError as e:
             raise ChainBuildError(f"Gemini Couldn't be initialized for QnA: {e}")
 
-        prompt = Prompts.QAPrompt
-
         try:
-            retriever_chain = RunnableParallel({'retrieved': self.retriever, 'query': RunnablePassthrough()}) | self.re_ranker | RunnableLambda(self.combine_context)
-
-            logger.info('Building QnA chain')
-            qa_chain = RunnableSequence(prompt,
-                                    gemini,
-                                    parser)
+            retriever = RunnableLambda(self.search)
+            if self.config.rerank:
+                top_n = self.config.rerank_top_n
+                retriever_chain = (RunnableParallel({'retrieved': retriever, 'query': RunnablePassthrough(), 'top_k': RunnableLambda(lambda _: top_n)})
+                                   | self.re_ranker | RunnableLambda(self.combine_context))
+            else:
+                retriever_chain = retriever | RunnableLambda(lambda documents: documents[:self.config.rerank_top_n]) | RunnableLambda(self.combine_context)
         except Exception as e:
             logger.error(f'Failed to build QnA chain: {e}')
             raise ChainBuildError(f'Failed to build QnA chain: {e}')
         
         return qa_chain, retriever_chain    
     
-    def invoke(self, user_query: str) -> str:
-        """Process a user query and return the response"""
+    def answer_key(self, user_query: str) -> tuple[str, np.ndarray]:
+        """
+        Scope and query embedding of a cached answer. Answers are shared by every
+        conversation over the same documents (doc ids are content hashes) with the
+        same retrieval config that is at the same point, i.e. whose previous answer
+        is the same.
+        """
+        scope = content_hash(json.dumps([self.corpus, self.config.to_dict()]), namespace=self.chat_history.last_answer() or '')
+        return scope, self.re_ranker.embed_query(user_query)
+
+    def cached_answer(self, user_query: str) -> tuple[str, list[dict]] | None:
+        """Answer and sources of a similar earlier question, recorded in the chat history on a hit"""
+        if self.answer_cache is None or not self.corpus or not user_query or not user_query.strip():
+            return None
+        try:
+            cached = self.answer_cache.get(*self.answer_key(user_query))
+        except Exception as e:
+            logger.warning(f"Answer cache lookup failed: {e}")
+            return None
+        if cached is None:
+            return None
+
+        logger.info('Serving answer from the semantic answer cache')
+        self.chat_history.add_message(user_query, role='user')
+        self.chat_history.add_message(cached['response'], role='assistant')
+        return cached['response'], cached['sources']
+
+    def remember_answer(self, user_query: str, response: str, sources: list[dict]):
+        """Cache an answer, call before the response is added to the chat history"""
+        if self.answer_cache is None or not self.corpus:
+            return
+        try:
+            scope, vector = self.answer_key(user_query)
+            self.answer_cache.put(scope, vector, {'response': response, 'sources': sources})
+        except Exception as e:
+            logger.warning(f"Answer couldn't be cached: {e}")
+
+    @staticmethod
+    def normalise_query(user_query: str) -> str:
+        return ' '.join(user_query.lower().split())
+
+    def retrieval_key(self, user_query: str) -> tuple:
+        """Retrieval results stay valid until the session's corpus changes"""
+        return (self.session_id, self.vector_store.corpus_version(self.session_id), self.config, self.normalise_query(user_query))
+
+    def retrieve(self, user_query: str) -> dict:
+        """Context and sources for a query, served from the retrieval cache when repeated"""
+        key = self.retrieval_key(user_query)
+        documents = self.retrieval_cache.get(key)
+        if documents is None:
+            documents = self.retriever_chain.invoke(user_query)
+            self.retrieval_cache.put(key, documents)
+        else:
+            logger.info('Serving retrieval from the retrieval cache')
+        return documents
+
+    def prepare(self, user_query: str) -> tuple[dict, list[dict]]:
+        """Record the user query and retrieve context, returning the QA chain input and the sources"""
         if not user_query or not user_query.strip():
             logger.warning("Empty query provided to invoke")
             raise ValueError("Query cannot be empty")
         
         logger.info('Updating session Chat history with user query')
-        self.chat_history.add_message(user_query)
+        self.chat_history.add_message(user_query, role='user')
+
+        documents = self.retrieve(user_query)
+        with span('prompt_build'):
+            message = {
+                'query': user_query,
+                'document': documents["context"],
+                'chat_history': self.chat_history.format_history_for_chain()
+            }
+        return message, documents["sources"]
 
-        chat_history = self.chat_history.format_history_for_chain()
-        documents = self.retriever_chain.invoke(user_query)
+    def invoke(self, user_query: str) -> str:
+        """Process a user query and return the response"""
+        cached = self.cached_answer(user_query)
+        if cached is not None:
+            return cached
 
-        message = {
-            'query': user_query,
-            'document': documents["context"],
-            'chat_history': chat_history
-        }
+        message, sources = self.prepare(user_query)
         
         try:
-            start = time.perf_counter()
-            response = self.qa_chain.invoke(message)
-            end = time.perf_counter()
+            with span('llm') as timer:
+                response = self.qa_chain.invoke(message)
 
         except Exception as e:
             logger.error(f"Chain execution failed: {e}")
@@ -340,16 +722,49 @@ class DocumentQA:
         if not response:
             return "I apologize, but I couldn't generate a proper response to your query."
         
+        self.remember_answer(user_query, response, sources)
         logger.info('Updating session Chat history with LLM response')
-        self.chat_history.add_message(response)
+        self.chat_history.add_message(response, role='assistant')
         
-        logger.info(f"Query processed successfully, response length: {len(response)} and response time: {end-start}")
-        return response, documents["sources"]
-    
-    def get_vectorstore(self) -> Chroma:
+        logger.info(f"Query processed successfully, response length: {len(response)} and response time: {timer.seconds}")
+        return response, sources
+
+    def stream(self, message: dict, sources: list[dict] = None) -> Iterator[str]:
+        """
+        Stream the answer for a prepared message token by token.
+        The full response is added to the chat history once the stream ends,
+        and to the answer cache when the sources are given.
+        """
+        parts = []
+        try:
+            start = time.perf_counter()
+            for token in timed(self.qa_chain.stream(message), 'llm', streamed=True):
+                if not parts:
+                    observe('llm_first_token', time.perf_counter() - start)
+                    logger.info(f"First token after {time.perf_counter()-start} seconds")
+                parts.append(token)
+                yield token
+            end = time.perf_counter()
+
+        except Exception as e:
+            logger.error(f"Chain execution failed: {e}")
+            raise DocumentQAError(f"Failed to process query: {e}")
+
+        response = ''.join(parts)
+        if not response:
+            response = "I apologize, but I couldn't generate a proper response to your query."
+            yield response
+        elif sources is not None:
+            self.remember_answer(message['query'], response, sources)
+
+        logger.info('Updating session Chat history with LLM response')
+        self.chat_history.add_message(response, role='assistant')
+        logger.info(f"Query streamed successfully, response length: {len(response)} and response time: {end-start}")
+
+    def get_vectorstore(self) -> VectorStore:
         """Get the underlying vector store"""
         logger.info('Fetching Vector Store')
-        return _vector_store
+        return self.vector_store
 
         
     def get_retriever(self) -> VectorStoreRetriever:
@@ -0,0 +1,77 @@
+from dataclasses import dataclass, asdict, replace
+from typing import Literal
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+
+class RetrievalConfigError(Exception):
+    """Raised when a retrieval profile is unknown or invalid"""
+    pass
+
+
+@dataclass(frozen=True)
+class RetrievalConfig:
+    """
+    How chat questions are answered from the vector store:
+    search_type: dense search (similarity, mmr, similarity_score_threshold) or hybrid (mmr fused with BM25)
+    k: candidates returned by the search
+    fetch_k, lambda_mult: MMR candidate pool and diversity (1 is pure relevance)
+    score_threshold: minimum relevance for similarity_score_threshold and the dense half of hybrid
+    lexical_k: BM25 candidates fused in hybrid search
+    rerank: run the SentenceTransformer re-ranker over the candidates
+    rerank_top_n: chunks kept as context
+    """
+    search_type: Literal["similarity", "mmr", "similarity_score_threshold", "hybrid"] = "hybrid"
+    k: int = 10
+    fetch_k: int = 20
+    lambda_mult: float = 0.5
+    score_threshold: float = None
+    lexical_k: int = 10
+    rerank: bool = True
+    rerank_top_n: int = 5
+
+    def __post_init__(self):
+        if self.k <= 0 or self.rerank_top_n <= 0 or self.lexical_k < 0:
+            raise RetrievalConfigError(f"Invalid retrieval config: {self}")
+        if self.search_type == 'similarity_score_threshold' and self.score_threshold is None:
+            raise RetrievalConfigError("similarity_score_threshold search needs a score_threshold")
+
+    @property
+    def dense(self) -> "RetrievalConfig":
+        """Config of the dense half of a hybrid search"""
+        if self.search_type != 'hybrid':
+            return self
+        return replace(self, search_type='similarity_score_threshold' if self.score_threshold is not None else 'mmr')
+
+    def search_kwargs(self) -> dict:
+        """Keyword arguments of the langchain retriever for this search type"""
+        kwargs = {'k': self.k}
+        if self.search_type == 'mmr':
+            kwargs.update(fetch_k=max(self.fetch_k, self.k), lambda_mult=self.lambda_mult)
+        elif self.search_type == 'similarity_score_threshold':
+            kwargs.update(score_threshold=self.score_threshold)
+        return kwargs
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+PROFILES = {
+    # Few candidates and a short context for interactive chat
+    'chat': RetrievalConfig(search_type='hybrid', k=8, fetch_k=20, lexical_k=8, rerank=True, rerank_top_n=5),
+    # No re-ranker, for the lowest latency
+    'fast': RetrievalConfig(search_type='similarity', k=5, rerank=False, rerank_top_n=5),
+    # Wide candidate pool and a long context for broad questions
+    'recall': RetrievalConfig(search_type='hybrid', k=20, fetch_k=50, lambda_mult=0.7, lexical_k=20, rerank=True, rerank_top_n=10),
+}
+
+
+def get_retrieval_config(profile: str = None) -> RetrievalConfig:
+    """Retrieval config of a profile, defaulting to PAPERMIND_RETRIEVAL_PROFILE (chat)"""
+    profile = (profile or os.getenv('PAPERMIND_RETRIEVAL_PROFILE', 'chat')).lower()
+    if profile not in PROFILES:
+        raise RetrievalConfigError(f"Unknown retrieval profile: {profile}")
+    return PROFILES[profile]
@@ -0,0 +1,366 @@
+from typing import Iterable, Iterator
+import threading
+import sqlite3
+import logging
+import json
+import os
+
+
+logger = logging.getLogger(__name__)
+
+
+class StoreError(Exception):
+    """Raised when session store operations fail"""
+    pass
+
+
+class SQLiteStore:
+    """
+    SQLite database holding per-session rows, with one connection per thread.
+    Without a path the database lives in memory and is meant for a single thread.
+    """
+    SCHEMA: tuple[str, ...] = ()
+
+    def __init__(self, path: str = None):
+        self.path = path or ':memory:'
+        self._local = threading.local()
+        self._memory = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        with self._connect() as connection:
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+        logger.info(f"{type(self).__name__} opened at {self.path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread, a single shared one for in-memory stores"""
+        if self.path == ':memory:':
+            if self._memory is None:
+                self._memory = sqlite3.connect(self.path, check_same_thread=False)
+            return self._memory
+
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+
+class ChunkStore(SQLiteStore):
+    """
+    Chunks uploaded by every session, so the session itself only carries ids.
+    Chunks are keyed by (session_id, doc_id, chunk_id): uploading the same
+    source twice keeps the first copy. Each chunk also records when its
+    upload happened and the source's position in it, since the sources of
+    an upload are stored in whatever order they finish loading. The
+    documents table points at one complete copy of each source, so another
+    upload of it can reuse its chunks.
+    Every change to a session's chunks bumps its version, which every worker
+    process sees.
+    """
+    SCHEMA = ("""
+        CREATE TABLE IF NOT EXISTS chunks (
+            session_id TEXT NOT NULL,
+            doc_id TEXT NOT NULL,
+            chunk_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            metadata TEXT NOT NULL,
+            uploaded_at REAL NOT NULL DEFAULT 0,
+            source_index INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (session_id, doc_id, chunk_id)
+        )
+    """, """
+        CREATE INDEX IF NOT EXISTS chunks_by_position
+        ON chunks (session_id, uploaded_at, source_index, chunk_id)
+    """, """
+        CREATE TABLE IF NOT EXISTS documents (
+            doc_id TEXT PRIMARY KEY,
+            session_id TEXT NOT NULL,
+            chunk_count INTEGER NOT NULL,
+            loaded_at REAL NOT NULL
+        )
+    """, """
+        CREATE TABLE IF NOT EXISTS versions (
+            session_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    """)
+    _BUMP = "INSERT INTO versions VALUES (?, 1) ON CONFLICT (session_id) DO UPDATE SET version = version + 1"
+
+    def add(self, session_id: str, chunks: Iterable[dict]) -> int:
+        """Store a session's chunks, returning how many were new"""
+        rows = [(session_id,
+                 chunk['metadata'].get('doc_id', ''),
+                 chunk['metadata'].get('chunk_id', 0),
+                 chunk['text'],
+                 json.dumps(chunk['metadata']),
+                 chunk['metadata'].get('uploaded_at', 0),
+                 chunk['metadata'].get('source_index', 0)) for chunk in chunks]
+        try:
+            with self._connect() as connection:
+                before = connection.total_changes
+                connection.executemany("INSERT OR IGNORE INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                added = connection.total_changes - before
+                if added:
+                    connection.execute(self._BUMP, (session_id,))
+            logger.debug(f"Stored {added} of {len(rows)} chunks for session {session_id}")
+            return added
+        except sqlite3.Error as e:
+            logger.error(f"Failed to store chunks: {e}")
+            raise StoreError(f"Failed to store chunks: {e}")
+
+    def get(self, session_id: str) -> list[dict]:
+        """Every chunk of a session in upload order"""
+        if not session_id:
+            return []
+        try:
+            rows = self._connect().execute(
+                "SELECT text, metadata FROM chunks WHERE session_id = ? "
+                "ORDER BY uploaded_at, source_index, chunk_id", (session_id,)).fetchall()
+        except sqlite3.Error as e:
+            raise StoreError(f"Failed to read chunks: {e}")
+        return [{'text': text, 'metadata': json.loads(metadata)} for text, metadata in rows]
+
+    def count(self, session_id: str) -> int:
+        if not session_id:
+            return 0
+        try:
+            return self._connect().execute(
+                "SELECT COUNT(*) FROM chunks WHERE session_id = ?", (session_id,)).fetchone()[0]
+        except sqlite3.Error as e:
+            raise StoreError(f"Failed to count chunks: {e}")
+
+    def version(self, session_id: str) -> int:
+        """Number that changes whenever the session's chunks change, 0 before the first upload"""
+        if not session_id:
+            return 0
+        try:
+            row = self._connect().execute(
+                "SELECT version FROM versions WHERE session_id = ?", (session_id,)).fetchone()
+        except sqlite3.Error as e:
+            raise StoreError(f"Failed to read version: {e}")
+        return row[0] if row else 0
+
+    def add_document(self, session_id: str, doc_id: str, chunk_count: int, loaded_at: float) -> None:
+        """Record that a session holds every chunk of a source, loaded at loaded_at"""
+        try:
+            with self._connect() as connection:
+                connection.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)",
+                                   (doc_id, session_id, chunk_count, loaded_at))
+        except sqlite3.Error as e:
+            raise StoreError(f"Failed to store document: {e}")
+
+    def find_document(self, doc_id: str) -> tuple[str, float] | None:
+        """Session holding a complete copy of a source and when the source was loaded"""
+        try:
+            row = self._connect().execute(
+                "SELECT session_id, loaded_at FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        except sqlite3.Error as e:
+            raise StoreError(f"Failed to read document: {e}")
+        return tuple(row) if row else None
+
+    def iter_document(self, session_id: str, doc_id: str) -> Iterator[dict]:
+        """Chunks of one source of a session in order, read from the database as they are consumed"""
+        try:
+            rows = self._connect().execute(
+                "SELECT text, metadata FROM chunks WHERE session_id = ? AND doc_id = ? ORDER BY chunk_id",
+                (session_id, doc_id))
+            for text, metadata in rows:
+                yield {'text': text, 'metadata': json.loads(metadata)}
+        except sqlite3.Error as e:
+            raise StoreError(f"Failed to read chunks: {e}")
+
+    def delete_document(self, session_id: str, doc_id: str) -> None:
+        """Drop the chunks of one source of a session"""
+        try:
+            with self._connect() as connection:
+                connection.execute("DELETE FROM chunks WHERE session_id = ? AND doc_id = ?", (session_id, doc_id))
+                connection.execute("DELETE FROM documents WHERE session_id = ? AND doc_id = ?", (session_id, doc_id))
+                connection.execute(self._BUMP, (session_id,))
+        except sqlite3.Error as e:
+            raise StoreError(f"Failed to delete chunks: {e}")
+
+    def delete_session(self, session_id: str) -> None:
+        """Drop every chunk stored for a session"""
+        try:
+            with self._connect() as connection:
+                connection.execute("DELETE FROM chunks WHERE session_id = ?", (session_id,))
+                connection.execute("DELETE FROM documents WHERE session_id = ?", (session_id,))
+                connection.execute(self._BUMP, (session_id,))
+        except sqlite3.Error as e:
+            raise StoreError(f"Failed to delete chunks: {e}")
+
+
+class MessageStore(SQLiteStore):
+    """
+    Chat messages of every session and the rolling summary of each conversation.
+    A summary records the seq of the last message it covers.
+    """
+    SCHEMA = ("""
+        CREATE TABLE IF NOT EXISTS messages (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL
+        )
+    """, """
+        CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, seq)
+    """, """
+        CREATE TABLE IF NOT EXISTS summaries (
+            session_id TEXT PRIMARY KEY,
+            summary TEXT NOT NULL,
+            upto INTEGER NOT NULL
+        )
+    """)
+
+    def append(self, session_id: str, role: str, content: str) -> int:
+        """Store a message, returning its seq"""
+        try:
+            with self._connect() as connection:
+                return connection.execute("INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)",
+                                          (session_id, role, content)).lastrowid
+        except sqlite3.Error as e:
+            logger.error(f"Failed to store message: {e}")
+            raise StoreError(f"Failed to store message: {e}")
+
+    def messages(self, session_id: str, after: int = 0) -> list[dict]:
+        """Messages of a session with a seq greater than after, oldest first"""
+        if not session_id:
+            return []
+        try:
+            rows = self._connect().execute(
+                "SELECT seq, role, content FROM messages WHERE session_id = ? AND seq > ? ORDER BY seq",
+                (session_id, after)).fetchall()
+        except sqlite3.Error as e:
+            raise StoreError(f"Failed to read messages: {e}")
+        return [{'seq': seq, 'role': role, 'content': content} for seq, role, content in rows]
+
+    def last(self, session_id: str, role: str) -> str | None:
+        """Content of the newest message of a session with role"""
+        if not session_id:
+            return None
+        try:
+            row = self._connect().execute(
+                "SELECT content FROM messages WHERE session_id = ? AND role = ? ORDER BY seq DESC LIMIT 1",
+                (session_id, role)).fetchone()
+        except sqlite3.Error as e:
+            raise StoreError(f"Failed to read messages: {e}")
+        return row[0] if row else None
+
+    def count(self, session_id: str) -> int:
+        if not session_id:
+            return 0
+        try:
+            return self._connect().execute(
+                "SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)).fetchone()[0]
+        except sqlite3.Error as e:
+            raise StoreError(f"Failed to count messages: {e}")
+
+    def get_summary(self, session_id: str) -> tuple[str, int]:
+        """Summary of a session's older messages and the seq of the last one it covers"""
+        try:
+            row = self._connect().execute(
+                "SELECT summary, upto FROM summaries WHERE session_id = ?", (session_id,)).fetchone()
+        except sqlite3.Error as e:
+            raise StoreError(f"Failed to read summary: {e}")
+        return row if row else ('', 0)
+
+    def set_summary(self, session_id: str, summary: str, upto: int) -> None:
+        try:
+            with self._connect() as connection:
+                connection.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?)", (session_id, summary, upto))
+        except sqlite3.Error as e:
+            raise StoreError(f"Failed to store summary: {e}")
+
+    def delete_session(self, session_id: str) -> None:
+        """Drop every message and the summary of a session"""
+        try:
+            with self._connect() as connection:
+                connection.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                connection.execute("DELETE FROM summaries WHERE session_id = ?", (session_id,))
+        except sqlite3.Error as e:
+            raise StoreError(f"Failed to delete messages: {e}")
+
+
+class JobStore(SQLiteStore):
+    """
+    State of background ingestion jobs, so every worker process can report
+    on and merge a job whichever one accepted the upload.
+    """
+    SCHEMA = ("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            session_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            processed INTEGER NOT NULL,
+            chunk_count INTEGER NOT NULL,
+            files TEXT NOT NULL,
+            uploaded TEXT NOT NULL,
+            failed TEXT NOT NULL,
+            errors TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            finished_at REAL
+        )
+    """,)
+    _LISTS = ('files', 'uploaded', 'failed', 'errors')
+    _COLUMNS = ('id', 'session_id', 'status', 'total', 'processed', 'chunk_count') + _LISTS + ('created_at', 'finished_at')
+
+    def save(self, job: dict) -> None:
+        """Insert or overwrite a job's row"""
+        row = tuple(json.dumps(job[column]) if column in self._LISTS else job[column] for column in self._COLUMNS)
+        try:
+            with self._connect() as connection:
+                connection.execute(f"INSERT OR REPLACE INTO jobs VALUES ({', '.join('?' * len(row))})", row)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to store job: {e}")
+            raise StoreError(f"Failed to store job: {e}")
+
+    def get(self, job_id: str) -> dict | None:
+        try:
+            row = self._connect().execute(
+                f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        except sqlite3.Error as e:
+            raise StoreError(f"Failed to read job: {e}")
+        if row is None:
+            return None
+        job = dict(zip(self._COLUMNS, row))
+        for column in self._LISTS:
+            job[column] = json.loads(job[column])
+        return job
+
+    def prune(self, finished_before: float) -> None:
+        """Drop jobs that finished before a timestamp"""
+        try:
+            with self._connect() as connection:
+                connection.execute("DELETE FROM jobs WHERE finished_at < ?", (finished_before,))
+        except sqlite3.Error as e:
+            raise StoreError(f"Failed to prune jobs: {e}")
+
+
+STORE_DIR = 'SessionStore'
+_stores: dict[type, SQLiteStore] = {}
+_stores_lock = threading.Lock()
+
+
+def _get_store(cls: type[SQLiteStore], env: str, filename: str) -> SQLiteStore:
+    """Process-wide store of a class, opened on first use at env or under STORE_DIR"""
+    with _stores_lock:
+        if cls not in _stores:
+            _stores[cls] = cls(os.getenv(env, os.path.join(STORE_DIR, filename)))
+        return _stores[cls]
+
+
+def get_chunk_store() -> ChunkStore:
+    return _get_store(ChunkStore, 'PAPERMIND_CHUNK_STORE', 'chunks.db')
+
+
+def get_message_store() -> MessageStore:
+    return _get_store(MessageStore, 'PAPERMIND_MESSAGE_STORE', 'messages.db')
+
+
+def get_job_store() -> JobStore:
+    return _get_store(JobStore, 'PAPERMIND_JOB_STORE', 'jobs.db')
@@ -47,7 +47,7 @@ marked.setOptions({
             showTypingIndicator();
             
             try {
-                const response = await fetch('/chat', {
+                const response = await fetch('/chat/stream', {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json',
@@ -55,12 +55,11 @@ marked.setOptions({
                     body: JSON.stringify({ message: message })
                 });
                 
-                const data = await response.json();
-                
-                if (data.error) {
-                    addMessage(data.error, 'error');
+                if (!response.ok) {
+                    const data = await response.json();
+                    addMessage(data.error || 'Sorry, there was an error processing your request.', 'error');
                 } else {
-                    addMessage(data.response, 'assistant', data.sources);
+                    await renderStream(response);
                 }
                 
             } catch (error) {
@@ -77,6 +76,51 @@ marked.setOptions({
             }
         });
 
+// Read Server-Sent Events from a streamed response and render the answer as it arrives
+async function renderStream(response) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let content = '';
+    let sources = [];
+    let messageDiv = null;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+
+        for (const raw of events) {
+            const event = (raw.match(/^event: (.*)$/m) || [])[1];
+            const data = JSON.parse((raw.match(/^data: (.*)$/m) || [])[1] || 'null');
+
+            if (event === 'sources') {
+                sources = data;
+            } else if (event === 'token') {
+                if (!messageDiv) {
+                    hideTypingIndicator();
+                    messageDiv = document.createElement('div');
+                    messageDiv.className = 'message assistant';
+                    chatMessages.insertBefore(messageDiv, typingIndicator);
+                }
+                content += data;
+                messageDiv.innerHTML = marked.parse(content);
+                scrollToBottom();
+            } else if (event === 'done') {
+                if (messageDiv && sources.length > 0) {
+                    messageDiv.innerHTML += createSourcesElement(sources);
+                    scrollToBottom();
+                }
+            } else if (event === 'error') {
+                addMessage(data.error, 'error');
+            }
+        }
+    }
+}
+
 function addMessage(content, role, sources = null) {
     const messageDiv = document.createElement('div');
     messageDiv.className = `message ${role}`;
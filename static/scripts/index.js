@@ -240,10 +240,19 @@ async function autoUploadWithRefresh() {
         });
         
         if (response.ok) {
-            const message = await response.text();
-            showUploadStatus(message, 'success');
-            uploadSuccess = true;
-            console.log('Auto-upload successful:', message);
+            const job = await response.json();
+            const finished = await pollUploadJob(job.job_id);
+            if (finished.status === 'completed') {
+                const message = finished.errors.length > 0
+                    ? `Indexed ${finished.files.length} source(s), ${finished.errors.length} failed.`
+                    : 'Files uploaded & indexed successfully!';
+                showUploadStatus(message, 'success');
+                uploadSuccess = true;
+                console.log('Auto-upload successful:', message);
+            } else {
+                showUploadStatus(`Upload failed: ${finished.errors.join('; ')}`, 'error');
+                console.error('Upload failed:', finished.errors);
+            }
         } else {
             const errorText = await response.text();
             showUploadStatus(`Upload failed: ${errorText}`, 'error');
@@ -263,6 +272,24 @@ async function autoUploadWithRefresh() {
     }
 }
 
+// Poll an ingestion job until it completes or fails
+async function pollUploadJob(jobId) {
+    while (true) {
+        const response = await fetch(`/upload/${jobId}`);
+        const job = await response.json();
+
+        if (!response.ok) {
+            return { status: 'failed', files: [], errors: [job.error || 'Upload status unavailable'] };
+        }
+        if (job.status === 'completed' || job.status === 'failed') {
+            return job;
+        }
+
+        showUploadStatus(`Indexing document(s)... ${job.processed}/${job.total} processed`, 'loading');
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
 // Sidebar functionality
 function toggleSidebar() {
     const sidebar = document.getElementById('sidebar');
@@ -385,10 +412,72 @@ docForm.addEventListener("submit", function (e) {
         return false;
     }
             
+    e.preventDefault();
+    streamResult(document.getElementById("query").value);
+});
+
+// Read Server-Sent Events from a streamed response, calling onEvent for each
+async function readEvents(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+
+        for (const raw of events) {
+            const event = (raw.match(/^event: (.*)$/m) || [])[1];
+            const data = JSON.parse((raw.match(/^data: (.*)$/m) || [])[1] || 'null');
+            onEvent(event, data);
+        }
+    }
+}
+
+// Stream the generated material into the result area, rendering markdown as it arrives
+async function streamResult(query) {
+    const formData = new FormData();
+    formData.append('query', query);
+
     loader.style.display = "block";
     submitBtn.disabled = true;
     submitBtn.textContent = "Processing...";
-});
+    resultDiv.innerHTML = '';
+    let content = '';
+
+    try {
+        const response = await fetch('/generate/stream', {
+            method: 'POST',
+            body: formData
+        });
+
+        if (!response.ok) {
+            resultDiv.textContent = await response.text();
+            return;
+        }
+
+        await readEvents(response, (event, data) => {
+            if (event === 'token') {
+                loader.style.display = "none";
+                content += data;
+                resultDiv.innerHTML = renderMarkdown(content);
+            } else if (event === 'error') {
+                resultDiv.textContent = data.error;
+            }
+        });
+    } catch (error) {
+        console.error('Generation error:', error);
+        resultDiv.textContent = 'Sorry, there was an error generating the material.';
+    } finally {
+        loader.style.display = "none";
+        submitBtn.disabled = false;
+        submitBtn.textContent = "Process All Inputs";
+    }
+}
         
 function renderMarkdown(content) {
     if (!isMarkdownContent(content)) {
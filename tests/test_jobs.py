@@ -0,0 +1,102 @@
+import io
+import time
+import pytest
+from flask import Flask
+from werkzeug.datastructures import FileStorage
+from docflow.ingestion import File
+from docflow.jobs import IngestionQueue
+from docflow.store import ChunkStore, JobStore
+
+
+class FakeVectorStore:
+    """Records the chunks the queue indexes per session instead of embedding them"""
+
+    def __init__(self):
+        self.chunks = {}
+
+    def add_documents(self, chunks: list[dict], session_id: str):
+        self.chunks.setdefault(session_id, []).extend(chunks)
+
+    def delete_document(self, session_id: str, doc_id: str):
+        self.chunks[session_id] = [chunk for chunk in self.chunks.get(session_id, [])
+                                   if chunk['metadata']['doc_id'] != doc_id]
+
+
+@pytest.fixture
+def files(tmp_path):
+    app = Flask(__name__)
+    app.config['UPLOAD_FOLDER'] = str(tmp_path / 'uploads')
+    return File(app)
+
+
+@pytest.fixture
+def chunk_store():
+    return ChunkStore(':memory:')
+
+
+@pytest.fixture
+def ingestion_queue(files, chunk_store):
+    ingestion_queue = IngestionQueue(files, FakeVectorStore(), precompute_rerank=False, batch_size=4,
+                                     chunk_store=chunk_store, job_store=JobStore(':memory:'))
+    yield ingestion_queue
+    ingestion_queue.shutdown()
+
+
+def upload(content: bytes, filename: str = 'notes.txt') -> FileStorage:
+    return FileStorage(stream=io.BytesIO(content), filename=filename)
+
+
+def pasted(text: str, group_id: int = 0) -> dict:
+    source = {'group_id': group_id, 'file_type': 'pasted', 'path': None, 'ext': None, 'name': 'Pasted Text', 'text': text}
+    source['hash'] = File.source_hash(source)
+    return source
+
+
+def wait(ingestion_queue: IngestionQueue, job_id: str, timeout: float = 10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = ingestion_queue.get(job_id)
+        if job.done:
+            return job
+        time.sleep(0.01)
+    raise TimeoutError(f"Ingestion job {job_id} did not finish")
+
+
+def test_file_save_hashes_the_saved_bytes(files):
+    content = b"The same notes uploaded twice.\n" * 100
+    first_path, ext, _, first_hash = files.file_save(upload(content), 'text', 'first')
+    second_path, _, _, second_hash = files.file_save(upload(content), 'text', 'second')
+
+    assert first_path != second_path
+    assert first_hash == second_hash
+    with open(first_path, 'rb') as f:
+        assert f.read() == content
+    assert first_hash == File.source_hash({'file_type': 'text', 'ext': ext, 'path': first_path})
+
+    _, _, _, other_hash = files.file_save(upload(content + b"!"), 'text', 'third')
+    assert other_hash != first_hash
+
+
+def test_reupload_reuses_stored_chunks(ingestion_queue, chunk_store, monkeypatch):
+    loads = []
+    iter_chunks = File.iter_chunks
+    monkeypatch.setattr(File, 'iter_chunks', lambda source, upload_time: loads.append(source) or iter_chunks(source, upload_time))
+    text = "\n\n".join(f"Paragraph {i} of a document worth splitting. " * 20 for i in range(20))
+
+    first = wait(ingestion_queue, ingestion_queue.submit('first', [pasted(text)], time.time()).id)
+    second = wait(ingestion_queue, ingestion_queue.submit('second', [pasted(text)], time.time()).id)
+
+    assert first.status == second.status == 'completed'
+    assert len(loads) == 1
+    assert second.chunk_count == first.chunk_count > 1
+    assert [chunk['text'] for chunk in chunk_store.get('second')] == [chunk['text'] for chunk in chunk_store.get('first')]
+
+
+def test_chunks_keep_source_order(ingestion_queue, chunk_store):
+    sources = [pasted(f"Source {i} says something. " * 200, group_id=i) for i in range(4)]
+    job = wait(ingestion_queue, ingestion_queue.submit('session', sources, time.time()).id)
+
+    assert job.status == 'completed'
+    doc_ids = [File.source_metadata(source, job.upload_time)['doc_id'] for source in sources]
+    stored = [(chunk['metadata']['doc_id'], chunk['metadata']['chunk_id']) for chunk in chunk_store.get('session')]
+    assert stored == sorted(stored, key=lambda key: (doc_ids.index(key[0]), key[1]))